@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -49,6 +50,8 @@ INTERNAL_IPS = [
 ]
 
 MIDDLEWARE = [
+    'store.metrics.MetricsMiddleware',
+    'store.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,11 +59,16 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
-    'debug_toolbar_force.middleware.ForceDebugToolbarMiddleware',
 ]
 
+if DEBUG:
+    # the toolbar middleware is sync only and would put every async view
+    # back on the thread pool, so it stays out of production
+    MIDDLEWARE += [
+        'debug_toolbar.middleware.DebugToolbarMiddleware',
+        'debug_toolbar_force.middleware.ForceDebugToolbarMiddleware',
+    ]
+
 ROOT_URLCONF = 'books.urls'
 
 TEMPLATES = [
@@ -85,22 +93,45 @@ WSGI_APPLICATION = 'books.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# BOOKS_DB_ENGINE=postgresql switches to Postgres, configured from the other BOOKS_DB_* variables
+if os.environ.get('BOOKS_DB_ENGINE') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('BOOKS_DB_NAME', 'books_db'),
+            'USER': os.environ.get('BOOKS_DB_USER', 'books_user'),
+            'PASSWORD': os.environ.get('BOOKS_DB_PASSWORD', ''),
+            'HOST': os.environ.get('BOOKS_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('BOOKS_DB_PORT', '5432'),
+            # a transaction-mode pooler (BOOKS_DB_POOLER=pgbouncer) hands every
+            # transaction to another server connection, named cursors can't follow
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('BOOKS_DB_POOLER') == 'pgbouncer',
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
-}
 
+# persistent connections, checked before a request reuses them
+DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('BOOKS_DB_CONN_MAX_AGE', 60))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# BOOKS_DB_REPLICA_HOST (Postgres) or BOOKS_DB_REPLICA_NAME (another SQLite
+# file, e.g. a copy of db.sqlite3) adds a read replica of the default database
+if os.environ.get('BOOKS_DB_REPLICA_HOST') or os.environ.get('BOOKS_DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ.get('BOOKS_DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'HOST': os.environ.get('BOOKS_DB_REPLICA_HOST', DATABASES['default'].get('HOST', '')),
+        # tests read and write the same test database through both aliases
+        'TEST': {'MIRROR': 'default'},
+    }
 
-# 'default': {
-#     'ENGINE': 'django.db.backends.postgresql_psycopg2',
-#     'NAME': 'books_db',
-#     'USER': 'books_user',
-#     'PASSWORD': '123',
-#     'HOST': 'localhost',
-#   'PORT': '5432',
-# }
+DATABASE_ROUTERS = ['store.routers.ReplicaRouter']
 
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.github.GithubOAuth2',
@@ -113,6 +144,13 @@ SOCIAL_AUTH_GITHUB_SECRET = 'd571d75401831d4f0f0bd08c8dec692c2e562f1d'
 
 SOCIAL_AUTH_URL_NAMESPACE = 'social'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'books',
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -163,6 +201,46 @@ REST_FRAMEWORK = {
     )
 }
 
+BOOK_PAGE_SIZE = 20
+BOOK_READERS_PREVIEW_SIZE = 5
+BOOK_READERS_PAGE_SIZE = 50
+BOOK_FAST_SERIALIZER = False
+BOOK_LEADERBOARD_SIZE = 10
+BOOK_SIMILAR_SIZE = 10
+BOOK_SIMILAR_TOP_K = 20
+BOOK_SIMILAR_MIN_COMMON = 2
+BOOK_SIMILAR_MIN_RATE = 4
+BOOK_EXPORT_CHUNK_SIZE = 2000
+BOOK_RELATION_BULK_MAX_ITEMS = 500
+BOOK_RATING_DEFERRED = False
+BOOK_RATING_MAX_STALENESS = 30
+BOOK_RATING_BATCH_SIZE = 500
+BOOK_CACHE_ALIAS = 'default'
+BOOK_CACHE_TIMEOUT = 300
+BOOK_METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+# /metrics answers 404 until one of these is set
+BOOK_METRICS_TOKEN = None
+BOOK_METRICS_ALLOWED_IPS = ()
+BOOK_PROFILE_SAMPLE_RATE = 0.0
+BOOK_PROFILE_DIR = None
+BOOK_REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+BOOK_REPLICA_APPS = ('store',)
+BOOK_REPLICA_PIN_SECONDS = 5
+# the production profile (BOOKS_DB_PROFILE=production): WAL lets readers run
+# alongside the writer and is stored in the database file itself,
+# synchronous=NORMAL only fsyncs on checkpoints (safe in WAL mode)
+BOOK_SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+# set on every SQLite connection; writers wait busy_timeout ms for the lock instead of failing
+if os.environ.get('BOOKS_DB_PROFILE') == 'production':
+    BOOK_SQLITE_PRAGMAS = BOOK_SQLITE_PRODUCTION_PRAGMAS
+else:
+    BOOK_SQLITE_PRAGMAS = {'busy_timeout': 5000}
+
 if DEBUG:
     import mimetypes
     mimetypes.add_type("application/javascript", ".js", True)
\ No newline at end of file
@@ -18,6 +18,8 @@ from django.contrib import admin
 from django.urls import path, re_path, include
 from rest_framework.routers import SimpleRouter
 
+from store.async_views import AsyncBookDetailView, AsyncBookListView, AsyncUserBookRelationView
+from store.metrics import metrics
 from store.views import BookViewSet, auth, UserBookRelationViewSet
 
 router = SimpleRouter()
@@ -29,7 +31,11 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     re_path('', include('social_django.urls', namespace='social')),
     path('auth/', auth),
-    path('__debug__/', include('debug_toolbar.urls'))
+    path('__debug__/', include('debug_toolbar.urls')),
+    path('metrics', metrics, name='metrics'),
+    path('async/book/', AsyncBookListView.as_view(), name='async-book-list'),
+    path('async/book/<int:pk>/', AsyncBookDetailView.as_view(), name='async-book-detail'),
+    path('async/book_relation/<int:book>/', AsyncUserBookRelationView.as_view(), name='async-userbookrelation-detail'),
 ]
 
 urlpatterns += router.urls
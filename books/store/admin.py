@@ -1,12 +1,21 @@
 from django.contrib import admin
 from django.contrib.admin import ModelAdmin
 
+from store.bookrelation import STATS_FIELDS
 from store.models import Book, UserBookRelation
 
 
 @admin.register(Book)
 class BookAdmin(ModelAdmin):
-    pass
+    # kept by the relation stats UPDATEs, a form would write back stale values
+    readonly_fields = ('rating', *STATS_FIELDS)
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.save()
+        elif form.changed_data:
+            # only the edited columns, the rest may have moved since the form was read
+            obj.save(update_fields=[*form.changed_data, 'updated_at'])
 
 @admin.register(UserBookRelation)
 class UserBookRelationAdmin(ModelAdmin):
@@ -0,0 +1,107 @@
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+
+from store.models import Book, UserBookRelation
+from store.views import BookViewSet, UserBookRelationViewSet
+
+
+def json_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def error_response(exc):
+    if isinstance(exc, Http404):
+        exc = exceptions.NotFound()
+    status = exc.status_code
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        # session auth comes first and sends no WWW-Authenticate header, so DRF answers 403
+        status = 403
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return json_response(data, status)
+
+
+class AsyncAPIView(View):
+    # Async entry point for a sync viewset: authentication, permissions,
+    # parsers, filter backends, paginator and serializers all come from the
+    # viewset, only the queries are awaited instead of run on the thread pool.
+    viewset_class = None
+    action_map = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # like APIView, CSRF is enforced by SessionAuthentication instead
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        viewset = self.viewset_class(action_map=self.action_map, args=args, kwargs=kwargs, format_kwarg=None)
+        viewset.request = request = viewset.initialize_request(request, *args, **kwargs)
+        viewset.headers = {}
+        self.viewset = viewset
+        try:
+            if request.method.lower() not in self.action_map:
+                raise exceptions.MethodNotAllowed(request.method)
+            # resolving the user reads the session
+            await sync_to_async(viewset.perform_authentication)(request)
+            viewset.check_permissions(request)
+            return await getattr(self, request.method.lower())(request, *args, **kwargs)
+        except (exceptions.APIException, Http404) as exc:
+            return error_response(exc)
+
+
+class AsyncBookListView(AsyncAPIView):
+    viewset_class = BookViewSet
+    action_map = {'get': 'list'}
+
+    async def get(self, request):
+        viewset = self.viewset
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        paginator = viewset.paginator
+        if viewset.fast_list:
+            rows = paginator.get_page([row async for row in viewset.get_fast_rows(queryset)])
+            data = await viewset.get_serializer(rows).adata()
+        else:
+            # async for runs the prefetches too, aiterator() would skip them
+            books = paginator.get_page([book async for book in paginator.get_page_queryset(queryset, request)])
+            data = viewset.get_serializer(books, many=True).data
+        return json_response(paginator.get_paginated_response(data).data)
+
+
+class AsyncBookDetailView(AsyncAPIView):
+    viewset_class = BookViewSet
+    action_map = {'get': 'retrieve'}
+
+    async def get(self, request, pk):
+        viewset = self.viewset
+        book = await viewset.filter_queryset(viewset.get_queryset()).filter(pk=pk).afirst()
+        if book is None:
+            raise exceptions.NotFound()
+        viewset.check_object_permissions(request, book)
+        return json_response(viewset.get_serializer(book).data)
+
+
+class AsyncUserBookRelationView(AsyncAPIView):
+    viewset_class = UserBookRelationViewSet
+    action_map = {'patch': 'partial_update'}
+
+    async def patch(self, request, book):
+        viewset = self.viewset
+        relation = await UserBookRelation.objects.filter(user=request.user, book_id=book).afirst()
+        if relation is None:
+            if not await Book.objects.filter(pk=book).aexists():
+                raise exceptions.NotFound()
+            relation = UserBookRelation(user=request.user, book_id=book)
+        viewset.check_object_permissions(request, relation)
+        serializer = viewset.get_serializer(relation, data=request.data, partial=True)
+        # the book stats are updated in the same transaction as the relation,
+        # and there is no async transaction.atomic(), so the write stays sync
+        await sync_to_async(self.save)(serializer)
+        return json_response(serializer.data)
+
+    def save(self, serializer):
+        serializer.is_valid(raise_exception=True)
+        self.viewset.perform_update(serializer)
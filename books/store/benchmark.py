@@ -0,0 +1,164 @@
+import json
+import random
+import statistics
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from store.bookrelation import rebuild_book_stats
+from store.models import Book, UserBookRelation
+from store.pagination import encode_cursor
+from store.search import rebuild_search_index
+
+WORDS = ('night', 'river', 'stone', 'garden', 'winter', 'silver', 'empire', 'shadow', 'letter', 'voyage',
+         'secret', 'island', 'mirror', 'forest', 'city', 'storm', 'promise', 'machine', 'harbor', 'crown')
+
+# queries per request, independent of catalog size; session and user lookups and the locked
+# re-read of the relation included for PATCH, the ETag/Last-Modified validators query included
+# for reads (it is cached with the response)
+QUERY_BUDGETS = {
+    'list': 3,
+    'list_deep_page': 3,
+    'detail': 3,
+    'search': 3,
+    'ordering_price': 3,
+    'ordering_author': 3,
+    'patch': 8,
+}
+
+
+def seed_catalog(books, users, relations, batch_size=10000, seed=0):
+    rng = random.Random(seed)
+    authors = max(books // 10, 1)
+
+    User.objects.bulk_create(
+        (User(username=f'bench_user_{i}', first_name=f'First {i}', last_name=f'Last {i}', password='!')
+         for i in range(users)), batch_size=batch_size)
+    Book.objects.bulk_create(
+        (Book(name=f'{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}',
+              price=Decimal(rng.randrange(100, 100000)) / 100,
+              author_name=f'Author {rng.randrange(authors)}')
+         for i in range(books)), batch_size=batch_size)
+
+    user_ids = list(User.objects.filter(username__startswith='bench_user_').values_list('id', flat=True))
+    book_ids = list(Book.objects.values_list('id', flat=True))
+    per_user = min(max(relations // max(len(user_ids), 1), 1), len(book_ids))
+    batch = []
+    for user_id in user_ids:
+        # sampling without replacement keeps (user, book) unique
+        for book_id in rng.sample(book_ids, per_user):
+            rate = rng.choice((None, 1, 2, 3, 4, 5))
+            batch.append(UserBookRelation(user_id=user_id, book_id=book_id, rate=rate,
+                                          like=rng.random() < 0.3, in_bookmarks=rng.random() < 0.1))
+            if len(batch) >= batch_size:
+                UserBookRelation.objects.bulk_create(batch)
+                batch = []
+    UserBookRelation.objects.bulk_create(batch)
+
+    rebuild_book_stats()
+    rebuild_search_index()
+
+
+def benchmark_requests():
+    middle = Book.objects.order_by('price', 'id')[Book.objects.count() // 2]
+    relation = UserBookRelation.objects.select_related('user').order_by('id').first()
+    list_url = reverse('book-list')
+    return {
+        'list': ('get', list_url, {}),
+        'list_deep_page': ('get', list_url, {'ordering': 'price',
+                                             'cursor': encode_cursor('price', middle.price, middle.id)}),
+        'detail': ('get', reverse('book-detail', args=(middle.id,)), {}),
+        'search': ('get', list_url, {'search': WORDS[0]}),
+        'ordering_price': ('get', list_url, {'ordering': '-price'}),
+        'ordering_author': ('get', list_url, {'ordering': 'author_name'}),
+        'patch': ('patch', reverse('userbookrelation-detail', args=(relation.book_id,)), relation.user),
+    }
+
+
+def run_benchmark(client, repeat=20):
+    results = {}
+    for name, (method, url, data) in benchmark_requests().items():
+        timings, queries = [], 0
+        if method == 'patch':
+            client.force_login(data)
+        for i in range(repeat):
+            payload = json.dumps({'rate': i % 5 + 1, 'like': bool(i % 2)})
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                if method == 'patch':
+                    response = client.patch(url, data=payload, content_type='application/json')
+                else:
+                    response = client.get(url, data)
+                timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, (name, response.status_code)
+            queries = max(queries, len(captured))
+        if method == 'patch':
+            client.logout()
+        timings.sort()
+        results[name] = {
+            'queries': queries,
+            'budget': QUERY_BUDGETS[name],
+            'min_ms': round(timings[0], 3),
+            'median_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        }
+    return results
+
+
+def over_budget(results):
+    return {name: result for name, result in results.items() if result['queries'] > result['budget']}
+
+
+def rate_books(user, book_ids, writes, seed, start, latencies, errors):
+    # one rater: its own client, thread and database connection
+    rng = random.Random(seed)
+    client = APIClient()
+    client.force_authenticate(user)
+    try:
+        start.wait()
+        for i in range(writes):
+            url = reverse('userbookrelation-detail', args=(rng.choice(book_ids),))
+            started = time.perf_counter()
+            try:
+                response = client.patch(url, data={'rate': rng.randint(1, 5), 'like': rng.random() < 0.5},
+                                        format='json')
+            except OperationalError:
+                # "database is locked" once busy_timeout runs out
+                errors.append(i)
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                errors.append(i)
+    finally:
+        connection.close()
+
+
+def run_concurrent_writes(raters=8, writes=50, seed=0):
+    users = list(User.objects.filter(username__startswith='bench_user_').order_by('id')[:raters])
+    book_ids = list(Book.objects.values_list('id', flat=True))
+    latencies, errors = [], []
+    start = threading.Barrier(len(users) + 1)
+    threads = [threading.Thread(target=rate_books, args=(user, book_ids, writes, seed + i, start, latencies, errors))
+               for i, user in enumerate(users)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'raters': len(users),
+        'writes': len(latencies),
+        'errors': len(errors),
+        'writes_per_s': round(len(latencies) / elapsed, 1),
+        'median_ms': round(statistics.median(latencies), 3) if latencies else None,
+        'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else None,
+    }
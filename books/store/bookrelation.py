@@ -1,9 +1,138 @@
-from django.db.models import Avg
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, F, FilteredRelation, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+from django.utils import timezone
 
 
+RATING_FIELDS = ('rating_sum', 'rating_count')
+STATS_FIELDS = (*RATING_FIELDS, 'likes_count', 'bookmarks_count', 'readers_count')
+USER_RELATION_FIELDS = {'my_like': 'like', 'my_in_bookmarks': 'in_bookmarks', 'my_rate': 'rate'}
 
-def set_rating(book):
+
+def relation_stats(values):
+    # contribution of a single relation row to the aggregates stored on its book
+    if values is None:
+        return dict.fromkeys(STATS_FIELDS, 0)
+    rate = values.get('rate')
+    return {
+        'rating_sum': rate or 0,
+        'rating_count': int(rate is not None),
+        'likes_count': int(bool(values.get('like'))),
+        'bookmarks_count': int(bool(values.get('in_bookmarks'))),
+        'readers_count': 1,
+    }
+
+
+def stats_expressions(deltas):
+    expressions = {field: F(field) + delta for field, delta in deltas.items()}
+    if 'rating_sum' in deltas or 'rating_count' in deltas:
+        rating_sum = expressions.get('rating_sum', F('rating_sum'))
+        rating_count = expressions.get('rating_count', F('rating_count'))
+        # every right-hand side sees the row as it was before the UPDATE,
+        # so the rating is derived from the already shifted sum and count;
+        # rounded to the field's 2 places, keyset cursors compare against it
+        expressions['rating'] = Round(Cast(rating_sum, FloatField()) / NullIf(rating_count, Value(0)), 2)
+    return expressions
+
+
+def update_book_stats(book_id, old=None, new=None):
+    from store.models import Book
+    old_stats, new_stats = relation_stats(old), relation_stats(new)
+    deltas = {field: new_stats[field] - old_stats[field] for field in new_stats}
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if settings.BOOK_RATING_DEFERRED and any(field in deltas for field in RATING_FIELDS):
+        # the rating is left to the process_rating_queue worker
+        mark_rating_pending(book_id)
+        deltas = {field: delta for field, delta in deltas.items() if field not in RATING_FIELDS}
+    if not deltas:
+        return 0
+    # queryset.update() skips auto_now, conditional requests rely on updated_at
+    return Book.objects.filter(pk=book_id).update(updated_at=timezone.now(), **stats_expressions(deltas))
+
+
+def mark_rating_pending(book_id):
+    from store.models import PendingRating
+    # INSERT OR IGNORE keeps the earliest mark, which is what staleness is measured from
+    PendingRating.objects.bulk_create([PendingRating(book_id=book_id)], ignore_conflicts=True)
+
+
+def annotate_user_relation(queryset, user):
+    # a LEFT JOIN on the (user, book) unique index, at most one row per book,
+    # so the user's state comes with the books in the same query
+    return queryset.annotate(
+        user_relation=FilteredRelation('userbookrelation', condition=Q(userbookrelation__user=user)),
+        **{name: F(f'user_relation__{field}') for name, field in USER_RELATION_FIELDS.items()},
+        my_updated_at=F('user_relation__updated_at'),
+    )
+
+
+def _relations_aggregate(aggregate, **filters):
     from store.models import UserBookRelation
-    rating = UserBookRelation.objects.filter(book=book).aggregate(rating=Avg('rate')).get('rating')
-    book.rating = rating
-    book.save()
\ No newline at end of file
+    return Subquery(
+        UserBookRelation.objects.filter(book=OuterRef('pk'), **filters)
+        .order_by().values('book').annotate(value=aggregate).values('value')
+    )
+
+
+def rebuild_book_stats(queryset=None, ratings_only=False):
+    from store.models import Book
+    if queryset is None:
+        queryset = Book.objects.all()
+    expressions = {
+        'rating_sum': Coalesce(_relations_aggregate(Sum('rate')), 0),
+        'rating_count': Coalesce(_relations_aggregate(Count('rate')), 0),
+        'rating': Round(_relations_aggregate(Avg('rate')), 2),
+    }
+    if not ratings_only:
+        expressions.update(
+            likes_count=Coalesce(_relations_aggregate(Count('pk'), like=True), 0),
+            bookmarks_count=Coalesce(_relations_aggregate(Count('pk'), in_bookmarks=True), 0),
+            readers_count=Coalesce(_relations_aggregate(Count('pk')), 0),
+        )
+    return queryset.update(updated_at=timezone.now(), **expressions)
+
+
+def process_pending_ratings(book_ids):
+    from store.cache import invalidate_books
+    from store.models import Book, PendingRating
+    with transaction.atomic():
+        # the marks go first: a vote landing while the batch is recomputed
+        # marks its book again and is picked up by the next run
+        PendingRating.objects.filter(book_id__in=book_ids).delete()
+        updated = rebuild_book_stats(Book.objects.filter(pk__in=book_ids), ratings_only=True)
+    invalidate_books(*book_ids)
+    return updated
+
+
+def set_rating(book):
+    from store.models import Book
+    rebuild_book_stats(Book.objects.filter(pk=book.pk))
+    book.refresh_from_db(fields=['rating', *STATS_FIELDS])
+
+
+def bulk_update_relations(user, items):
+    from store.cache import invalidate_books
+    from store.models import Book, UserBookRelation
+    book_ids = [item['book'] for item in items]
+    fields = ('like', 'in_bookmarks', 'rate')
+    with transaction.atomic():
+        # fields left out of an item keep their stored value
+        existing = {relation.book_id: relation
+                    for relation in UserBookRelation.objects.filter(user=user, book_id__in=book_ids)}
+        relations = []
+        for item in items:
+            relation = existing.get(item['book']) or UserBookRelation(user=user, book_id=item['book'])
+            for field in fields:
+                if field in item:
+                    setattr(relation, field, item[field])
+            relations.append(relation)
+        # INSERT ... ON CONFLICT (user_id, book_id) DO UPDATE, so relations
+        # created concurrently are updated instead of duplicated
+        UserBookRelation.objects.bulk_create(relations, update_conflicts=True, unique_fields=['user', 'book'],
+                                             update_fields=[*fields, 'updated_at'])
+        # bulk writes skip save(), so the book stats are rebuilt once per book afterwards
+        rebuild_book_stats(Book.objects.filter(pk__in=book_ids))
+    invalidate_books(*book_ids)
+    saved = {relation.book_id: relation for relation in UserBookRelation.objects.filter(user=user, book_id__in=book_ids)}
+    return [saved[book_id] for book_id in book_ids]
@@ -0,0 +1,179 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from store.routers import replica_reads
+
+CATALOG_VERSION_KEY = 'books:version:catalog'
+LIST_VERSION_KEY = 'books:version:list'
+BOOK_VERSION_KEY = 'books:version:book:{}'
+WRITTEN_KEY = 'books:written'
+HITS_KEY = 'books:stats:hits'
+MISSES_KEY = 'books:stats:misses'
+
+
+def get_cache():
+    return caches[settings.BOOK_CACHE_ALIAS]
+
+
+def get_version(key):
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        # seeding from the clock means a counter that was evicted never comes
+        # back at a value that old entries were stored under
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_versions(keys):
+    cache = get_cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def committed(keys):
+    bump_versions(keys)
+    # replicas may not have the write for BOOK_REPLICA_PIN_SECONDS
+    get_cache().set(WRITTEN_KEY, True, settings.BOOK_REPLICA_PIN_SECONDS)
+
+
+def invalidate_books(*book_ids):
+    keys = [LIST_VERSION_KEY, *(BOOK_VERSION_KEY.format(pk) for pk in book_ids)]
+    bump_versions(keys)
+    # bump again once the data is visible to other connections, otherwise a
+    # concurrent read could cache the pre-commit state under the new version
+    transaction.on_commit(lambda: committed(keys))
+
+
+def invalidate_catalog():
+    # for bulk loads that skip the model signals, drops every cached response at once
+    bump_versions([CATALOG_VERSION_KEY])
+    transaction.on_commit(lambda: committed([CATALOG_VERSION_KEY]))
+
+
+def replica_may_lag():
+    # what a replica returns this soon after a write may predate it, so it is
+    # served but not cached under the version the write bumped
+    return replica_reads.get() and get_cache().get(WRITTEN_KEY) is not None
+
+
+def request_identity(request, user_id=None):
+    params = sorted((key, value) for key, values in request.query_params.lists() for value in values)
+    # absolute pagination links depend on the host the request came in on
+    return f'{user_id}@{request.scheme}://{request.get_host()}{request.path}?{urlencode(params)}'
+
+
+def response_key(request, version_key, user_id=None):
+    digest = hashlib.md5(request_identity(request, user_id).encode('utf-8')).hexdigest()
+    versions = f'{get_version(CATALOG_VERSION_KEY)}:{get_version(version_key)}'
+    return f'books:response:{version_key}:{versions}:{digest}'
+
+
+def record(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def cache_stats():
+    cache = get_cache()
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else 0.0}
+
+
+class CachedResponseMixin:
+    # Serves list/retrieve from the rendered JSON stored under a key built
+    # from the normalized query params and the current data version.
+    # Responses to any of per_user_params are cached per user. Misses read
+    # from a replica like any other safe request, but aren't stored while the
+    # replica may still lag behind the last write. Views that
+    # implement get_validators() also send ETag/Last-Modified and answer
+    # conditional requests with 304 before the cache is even looked at.
+    per_user_params = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, LIST_VERSION_KEY, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        # keyed on the pk invalidate_books() bumps, /book/07/ is the same book as /book/7/
+        try:
+            pk = int(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            # not a book, left to the view to answer 404
+            return super().retrieve(request, *args, **kwargs)
+        return self.cached_response(request, BOOK_VERSION_KEY.format(pk), super().retrieve, *args, **kwargs)
+
+    def get_validators(self):
+        # {'last_modified': datetime, ...anything else the ETag depends on} or None,
+        # without a last_modified only the ETag is sent
+        return None
+
+    def cached_response(self, request, version_key, view, *args, **kwargs):
+        cache = get_cache()
+        user_id = None
+        if any(param in request.query_params for param in self.per_user_params):
+            user_id = request.user.pk
+        key = response_key(request, version_key, user_id)
+
+        validators = self.conditional_validators(request, key, user_id)
+        if validators is not None:
+            etag, last_modified = validators
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return self.add_validators(not_modified, validators)
+
+        content = cache.get(key)
+        if content is not None:
+            record(HITS_KEY)
+            response = HttpResponse(content, content_type='application/json')
+            response['X-Cache'] = 'HIT'
+            return self.add_validators(response, validators)
+
+        record(MISSES_KEY)
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not replica_may_lag():
+            def store(rendered):
+                cache.set(key, rendered.rendered_content, settings.BOOK_CACHE_TIMEOUT)
+            response.add_post_render_callback(store)
+            self.add_validators(response, validators)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def conditional_validators(self, request, key, user_id):
+        # stored under the versioned response key, so they go stale together
+        cache = get_cache()
+        validators = cache.get(f'{key}:validators')
+        if validators is None:
+            values = self.get_validators()
+            if values is None:
+                return None
+            last_modified = values.pop('last_modified', None)
+            raw = f'{request_identity(request, user_id)}|{sorted(values.items())}|{last_modified}'
+            validators = (f'"{hashlib.md5(raw.encode("utf-8")).hexdigest()}"',
+                          None if last_modified is None else int(last_modified.timestamp()))
+            if not replica_may_lag():
+                cache.set(f'{key}:validators', validators, settings.BOOK_CACHE_TIMEOUT)
+        return validators
+
+    def add_validators(self, response, validators):
+        if validators is not None:
+            response['ETag'] = validators[0]
+            if validators[1] is not None:
+                response['Last-Modified'] = http_date(validators[1])
+        return response
@@ -0,0 +1,16 @@
+from django.conf import settings
+
+
+def configure_connection(connection):
+    # journal_mode=WAL is stored in the database file, the other pragmas only
+    # last as long as the connection, so all of them are set on every connect
+    if connection.vendor != 'sqlite' or not settings.BOOK_SQLITE_PRAGMAS:
+        return
+    # straight on the sqlite3 connection, these are not request queries
+    for name, value in settings.BOOK_SQLITE_PRAGMAS.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def sqlite_pragmas(connection, names):
+    with connection.cursor() as cursor:
+        return {name: cursor.execute(f'PRAGMA {name}').fetchone()[0] for name in names}
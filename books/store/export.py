@@ -0,0 +1,60 @@
+import csv
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from store.serializers import FastBooksSerializer
+
+CSV_FIELDS = ('id', 'name', 'price', 'author_name', 'annotated_likes', 'bookmarks_count', 'readers_count',
+              'rating', 'owner_name', 'readers')
+
+
+class Echo:
+    # csv.writer wants a file, this hands the formatted line straight back
+    def write(self, value):
+        return value
+
+
+def book_chunks(queryset, chunk_size):
+    # rows are read from a server-side cursor and serialized a chunk at a
+    # time, with one readers query per chunk, so memory stays flat
+    rows = FastBooksSerializer.get_rows(queryset).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield FastBooksSerializer(chunk).data
+
+
+def export_jsonl(queryset, chunk_size):
+    renderer = JSONRenderer()
+    for books in book_chunks(queryset, chunk_size):
+        yield b''.join(renderer.render(book) + b'\n' for book in books)
+
+
+def export_csv(queryset, chunk_size):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for books in book_chunks(queryset, chunk_size):
+        for book in books:
+            book['readers'] = '; '.join(f"{reader['first_name']} {reader['last_name']}".strip()
+                                        for reader in book['readers'])
+        yield ''.join(writer.writerow([book[field] for field in CSV_FIELDS]) for book in books)
+
+
+EXPORT_FORMATS = {
+    'jsonl': (export_jsonl, 'application/x-ndjson'),
+    'csv': (export_csv, 'text/csv'),
+}
+
+
+def export_response(queryset, file_format, chunk_size=None):
+    export, content_type = EXPORT_FORMATS[file_format]
+    if not queryset.ordered:
+        queryset = queryset.order_by('id')
+    response = StreamingHttpResponse(export(queryset, chunk_size or settings.BOOK_EXPORT_CHUNK_SIZE),
+                                     content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="books.{file_format}"'
+    return response
@@ -0,0 +1,54 @@
+from django_filters import rest_framework as filters
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
+
+from store.models import Book, UserBookRelation
+
+# sorts after every string starting with the prefix
+PREFIX_UPPER_BOUND = chr(0x10FFFF)
+
+
+class BookFilter(filters.FilterSet):
+    # every filter is a comparison on a bare indexed column, so each one can
+    # be answered with an index range scan instead of a table scan
+    min_price = filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = filters.NumberFilter(field_name='price', lookup_expr='lte')
+    min_rating = filters.NumberFilter(field_name='rating', lookup_expr='gte')
+    max_rating = filters.NumberFilter(field_name='rating', lookup_expr='lte')
+    author_name = filters.CharFilter()
+    author_prefix = filters.CharFilter(method='filter_author_prefix')
+    liked_by_me = filters.BooleanFilter(method='filter_by_me')
+    bookmarked_by_me = filters.BooleanFilter(method='filter_by_me')
+
+    # their results depend on who is asking
+    user_filters = ('liked_by_me', 'bookmarked_by_me')
+
+    class Meta:
+        model = Book
+        fields = ['price']
+
+    def filter_author_prefix(self, queryset, name, value):
+        # LIKE 'x%' can't use the index on SQLite, a range on the column can
+        return queryset.filter(author_name__gte=value, author_name__lt=value + PREFIX_UPPER_BOUND)
+
+    def filter_by_me(self, queryset, name, value):
+        user = self.request.user if self.request else None
+        if user is None or not user.is_authenticated:
+            return queryset.none() if value else queryset
+        flag = 'like' if name == 'liked_by_me' else 'in_bookmarks'
+        # walks the user's relations on the (user, book) index
+        books = UserBookRelation.objects.filter(user=user, **{flag: True}).values('book_id')
+        return queryset.filter(pk__in=books) if value else queryset.exclude(pk__in=books)
+
+
+class BookOrderingFilter(OrderingFilter):
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view) or ()
+        # pages are keyed on (field, id), a second field would be ignored
+        if len(ordering) > 1:
+            raise ValidationError({self.ordering_param: ['Order by one field at a time.']})
+        queryset = super().filter_queryset(request, queryset, view)
+        # an unrated book has no place in a ranking, and a NULL can't be a keyset cursor
+        if any(field.lstrip('-') == 'rating' for field in ordering):
+            queryset = queryset.filter(rating__isnull=False)
+        return queryset
@@ -0,0 +1,130 @@
+import csv
+import json
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from rest_framework import serializers
+
+from store.bookrelation import rebuild_book_stats
+from store.cache import invalidate_catalog
+from store.models import Book, UserBookRelation
+from store.search import rebuild_search_index
+from store.serializers import BooksSerializer, UserBookRelationBulkSerializer
+
+FILE_FORMATS = ('csv', 'jsonl')
+
+
+class BookImportSerializer(BooksSerializer):
+    # an explicit id lets relation rows point at the books of the same import
+    id = serializers.IntegerField(min_value=1, required=False)
+
+
+class RelationImportSerializer(UserBookRelationBulkSerializer):
+    user = serializers.IntegerField(min_value=1)
+
+
+def read_rows(path, file_format=None):
+    # yields (line number, row) without loading the file
+    file_format = file_format or path.rsplit('.', 1)[-1].lower()
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f'{path}: unsupported format {file_format!r}, use one of {", ".join(FILE_FORMATS)}')
+    with open(path, newline='', encoding='utf-8') as file:
+        if file_format == 'csv':
+            for line, row in enumerate(csv.DictReader(file), start=2):
+                # an empty cell is a value left out, not an empty string
+                yield line, {key: value for key, value in row.items() if value != ''}
+            return
+        for line, text in enumerate(file, start=1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text)
+            except ValueError as exc:
+                raise ValueError(f'{path}:{line}: {exc}')
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def validate(serializer_class, batch, errors):
+    valid = []
+    for line, row in batch:
+        serializer = serializer_class(data=row)
+        if serializer.is_valid():
+            valid.append((line, serializer.validated_data))
+        else:
+            errors.append((line, serializer.errors))
+    return valid
+
+
+def import_book_rows(rows, batch_size=1000, owner=None, progress=None):
+    imported, errors = 0, []
+    update_fields = ['name', 'price', 'author_name', 'updated_at'] + (['owner'] if owner else [])
+    for batch in batches(rows, batch_size):
+        books = [Book(owner=owner, **data) for line, data in validate(BookImportSerializer, batch, errors)]
+        with transaction.atomic():
+            # rows with a known id overwrite the book, so an import can be re-run
+            Book.objects.bulk_create(books, update_conflicts=True, unique_fields=['id'],
+                                     update_fields=update_fields)
+        imported += len(books)
+        if progress:
+            progress(imported, errors)
+    return imported, errors
+
+
+def import_relation_rows(rows, batch_size=1000, progress=None):
+    imported, errors = 0, []
+    for batch in batches(rows, batch_size):
+        items = validate(RelationImportSerializer, batch, errors)
+        user_ids = set(User.objects.filter(pk__in={item['user'] for line, item in items})
+                       .values_list('pk', flat=True))
+        book_ids = set(Book.objects.filter(pk__in={item['book'] for line, item in items})
+                       .values_list('pk', flat=True))
+        relations = {}
+        for line, item in items:
+            if item['user'] not in user_ids:
+                errors.append((line, {'user': [f"Unknown user {item['user']}."]}))
+                continue
+            if item['book'] not in book_ids:
+                errors.append((line, {'book': [f"Unknown book {item['book']}."]}))
+                continue
+            # a pair may only be written once per statement, the last row wins
+            relations[item['user'], item['book']] = UserBookRelation(
+                user_id=item['user'], book_id=item['book'], like=item.get('like', False),
+                in_bookmarks=item.get('in_bookmarks', False), rate=item.get('rate'))
+        with transaction.atomic():
+            UserBookRelation.objects.bulk_create(relations.values(), update_conflicts=True,
+                                                 unique_fields=['user', 'book'],
+                                                 update_fields=['like', 'in_bookmarks', 'rate', 'updated_at'])
+        imported += len(relations)
+        if progress:
+            progress(imported, errors)
+    return imported, errors
+
+
+def finish_import(books_imported, relations_imported):
+    # bulk_create skips save() and the signals, so everything derived is rebuilt once
+    if relations_imported:
+        rebuild_book_stats()
+    if books_imported:
+        # explicit ids don't advance the Postgres sequences, the next
+        # POST /book/ would get an id the import already took
+        reset_sequences(Book, UserBookRelation)
+        rebuild_search_index()
+    invalidate_catalog()
+
+
+def reset_sequences(*models):
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
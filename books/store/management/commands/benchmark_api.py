@@ -0,0 +1,67 @@
+import json
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from store.benchmark import seed_catalog, run_benchmark, over_budget
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway test database and time the book and relation endpoints, '
+            'failing when a request goes over its query budget')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--relations', type=int, default=1000000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--cache', action='store_true',
+                            help='Keep the response cache on, by default every request is a miss')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f"Seeding {options['books']} books, {options['users']} users, "
+                              f"{options['relations']} relations")
+            seed_catalog(options['books'], options['users'], options['relations'], seed=options['seed'])
+            caches = None if options['cache'] else {
+                'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+            with override_settings(**({'CACHES': caches} if caches else {})):
+                results = run_benchmark(APIClient(), repeat=options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'commit': self.git_commit(),
+            'created': timezone.now().isoformat(),
+            'catalog': {key: options[key] for key in ('books', 'users', 'relations')},
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        for name, result in results.items():
+            self.stdout.write(f"{name:<16} {result['queries']:>3}/{result['budget']:<3} queries  "
+                              f"median {result['median_ms']:>9.3f} ms  p95 {result['p95_ms']:>9.3f} ms")
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+        exceeded = over_budget(results)
+        if exceeded:
+            raise CommandError('Query budget exceeded: ' + ', '.join(
+                f"{name} ({result['queries']} > {result['budget']})" for name, result in exceeded.items()))
+
+    def git_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
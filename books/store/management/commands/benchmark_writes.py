@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from store.benchmark import seed_catalog, run_concurrent_writes
+from store.database import sqlite_pragmas
+
+# what a bare sqlite3 connection gets: rollback journal, fsync on every commit
+SQLITE_DEFAULTS = {'journal_mode': 'delete', 'synchronous': 'full', 'busy_timeout': 5000, 'mmap_size': 0}
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database and measure relation PATCH throughput with parallel raters, '
+            'each on its own thread and connection')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--relations', type=int, default=10000)
+        parser.add_argument('--raters', type=int, default=8)
+        parser.add_argument('--writes', type=int, default=50, help='PATCHes per rater')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', action='store_true',
+                            help='Also run with the SQLite defaults instead of BOOK_SQLITE_PRODUCTION_PRAGMAS')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # an in-memory database has no journal, WAL only shows on a file
+                connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                seed_catalog(options['books'], options['users'], options['relations'], seed=options['seed'])
+                results = {}
+                if options['baseline'] and connection.vendor == 'sqlite':
+                    results['baseline'] = self.run_round(options, BOOK_SQLITE_PRAGMAS=SQLITE_DEFAULTS,
+                                                         conn_max_age=0)
+                results['production'] = self.run_round(
+                    options, BOOK_SQLITE_PRAGMAS=settings.BOOK_SQLITE_PRODUCTION_PRAGMAS)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        for name, result in results.items():
+            self.stdout.write(f"{name:<11} {result['raters']} raters  {result['writes_per_s']:>8.1f} writes/s  "
+                              f"median {result['median_ms']:>8.3f} ms  p95 {result['p95_ms']:>8.3f} ms  "
+                              f"{result['errors']} errors  {result.get('pragmas', '')}")
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'created': timezone.now().isoformat(), 'vendor': connection.vendor,
+                           'options': options, 'results': results}, output, indent=2, default=str)
+
+    def run_round(self, options, conn_max_age=None, **overrides):
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        settings_dict = connection.settings_dict
+        old_max_age = settings_dict['CONN_MAX_AGE']
+        if conn_max_age is not None:
+            settings_dict['CONN_MAX_AGE'] = conn_max_age
+        try:
+            with override_settings(CACHES=caches, **overrides):
+                # reconnect so the pragmas of this round are applied
+                connection.close()
+                result = run_concurrent_writes(options['raters'], options['writes'], seed=options['seed'])
+                if connection.vendor == 'sqlite':
+                    result['pragmas'] = sqlite_pragmas(connection, ('journal_mode', 'synchronous'))
+                connection.close()
+        finally:
+            settings_dict['CONN_MAX_AGE'] = old_max_age
+        return result
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from store.cache import cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the book response cache'
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        self.stdout.write(f"hits: {stats['hits']}")
+        self.stdout.write(f"misses: {stats['misses']}")
+        self.stdout.write(f"hit ratio: {stats['hit_ratio']:.2%}")
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+class Command(BaseCommand):
+    help = ('Compute the "readers who liked this also liked" neighbours of every book '
+            'from the relations (needs numpy and scipy)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only refresh books changed since this ISO datetime')
+        parser.add_argument('--top-k', type=int, help='Neighbours kept per book, BOOK_SIMILAR_TOP_K by default')
+        parser.add_argument('--min-common', type=int,
+                            help='Readers two books need in common, BOOK_SIMILAR_MIN_COMMON by default')
+
+    def handle(self, *args, **options):
+        try:
+            from store.similarity import compute_similar_books
+        except ImportError as e:
+            raise CommandError(f'compute_similar_books needs numpy and scipy: {e}')
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"--since is not a datetime: {options['since']}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        started = time.perf_counter()
+        books, stored = compute_similar_books(since, options['top_k'], options['min_common'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {stored} neighbours for {books} books in {time.perf_counter() - started:.2f}s'))
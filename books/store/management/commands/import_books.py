@@ -0,0 +1,59 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from store.importer import FILE_FORMATS, finish_import, import_book_rows, import_relation_rows, read_rows
+
+
+class Command(BaseCommand):
+    help = ('Load books, and optionally user/book relations, from CSV or JSON Lines files in batches, '
+            'then rebuild the book stats and the search index once')
+
+    def add_arguments(self, parser):
+        parser.add_argument('books', nargs='?', help='name, price, author_name and an optional id per row')
+        parser.add_argument('--relations', help='user, book and optional like, in_bookmarks, rate per row')
+        parser.add_argument('--format', choices=FILE_FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT and transaction')
+        parser.add_argument('--owner', help='Username set as the owner of the imported books')
+        parser.add_argument('--max-errors', type=int, default=20, help='Invalid rows printed in full')
+
+    def handle(self, *args, **options):
+        if not options['books'] and not options['relations']:
+            raise CommandError('Give a books file, a --relations file or both')
+        owner = None
+        if options['owner']:
+            owner = User.objects.filter(username=options['owner']).first()
+            if owner is None:
+                raise CommandError(f"Unknown user {options['owner']}")
+
+        self.max_errors = options['max_errors']
+        self.imported = {'books': 0, 'relations': 0}
+        try:
+            if options['books']:
+                self.run('books', import_book_rows, options['books'], options, owner=owner)
+            if options['relations']:
+                self.run('relations', import_relation_rows, options['relations'], options)
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+        finally:
+            # batches committed before a failure still need their stats
+            self.stdout.write('Rebuilding book stats and search index')
+            finish_import(self.imported['books'], self.imported['relations'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.imported['books']} books and {self.imported['relations']} relations"))
+
+    def run(self, name, importer, path, options, **kwargs):
+        started = time.monotonic()
+
+        def progress(imported, errors):
+            self.imported[name] = imported
+            rate = imported / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f'{name}: {imported} imported, {len(errors)} invalid, {rate:.0f} rows/s')
+
+        imported, errors = importer(read_rows(path, options['format']), batch_size=options['batch_size'],
+                                    progress=progress, **kwargs)
+        for line, error in errors[:self.max_errors]:
+            self.stderr.write(f'{path}:{line}: {error}')
+        if len(errors) > self.max_errors:
+            self.stderr.write(f'{path}: {len(errors) - self.max_errors} more invalid rows')
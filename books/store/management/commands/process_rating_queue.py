@@ -0,0 +1,68 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from store.bookrelation import process_pending_ratings
+from store.models import PendingRating
+
+
+def process_in_thread(book_ids):
+    # pool threads open their own connections, close them once the batch is done
+    try:
+        return process_pending_ratings(book_ids)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Recompute the ratings of books marked pending while BOOK_RATING_DEFERRED is on'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Threads recomputing batches in parallel')
+        parser.add_argument('--batch-size', type=int, default=settings.BOOK_RATING_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=settings.BOOK_RATING_MAX_STALENESS / 2,
+                            help='Seconds to sleep between polls, never more than BOOK_RATING_MAX_STALENESS')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        interval = min(options['interval'], settings.BOOK_RATING_MAX_STALENESS)
+        workers = max(options['workers'], 1)
+        executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            while True:
+                processed = self.drain(executor, workers, options['batch_size'])
+                if processed:
+                    self.stdout.write(f'Recomputed ratings of {processed} books')
+                if options['once']:
+                    break
+                time.sleep(interval)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def drain(self, executor, workers, batch_size):
+        processed = 0
+        while True:
+            self.warn_if_stale()
+            # coalesced: a book voted on many times since the last run is a single row here
+            book_ids = list(PendingRating.objects.order_by('marked_at')
+                            .values_list('book_id', flat=True)[:batch_size * workers])
+            if not book_ids:
+                return processed
+            batches = [book_ids[i:i + batch_size] for i in range(0, len(book_ids), batch_size)]
+            if executor is None:
+                processed += sum(map(process_pending_ratings, batches))
+            else:
+                processed += sum(executor.map(process_in_thread, batches))
+
+    def warn_if_stale(self):
+        oldest = PendingRating.objects.order_by('marked_at').values_list('marked_at', flat=True).first()
+        limit = timedelta(seconds=settings.BOOK_RATING_MAX_STALENESS)
+        if oldest is not None and timezone.now() - oldest > limit:
+            self.stderr.write(f'Pending ratings are older than {limit}, consider more --workers')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from store.bookrelation import rebuild_book_stats
+from store.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Recompute the rating aggregates and counters stored on books from their relations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('book_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        queryset = Book.objects.all()
+        if options['book_ids']:
+            queryset = queryset.filter(pk__in=options['book_ids'])
+        updated = rebuild_book_stats(queryset)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {updated} books'))
@@ -0,0 +1,197 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+current_request = ContextVar('books_request_metrics', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'query_time', 'serializer_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.serializer_time = 0.0
+
+
+class Registry:
+    # Per process: every worker serves its own numbers, the scraper sums them.
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def observe(self, labels, duration, stats):
+        with self.lock:
+            endpoint = self.endpoints.get(labels)
+            if endpoint is None:
+                endpoint = self.endpoints[labels] = {
+                    'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0,
+                    'queries': 0, 'query_time': 0.0, 'serializer_time': 0.0,
+                }
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    endpoint['buckets'][i] += 1
+                    break
+            endpoint['count'] += 1
+            endpoint['sum'] += duration
+            endpoint['queries'] += stats.queries
+            endpoint['query_time'] += stats.query_time
+            endpoint['serializer_time'] += stats.serializer_time
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+
+    def render(self):
+        # Prometheus text exposition format
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            lines = [
+                '# HELP books_request_duration_seconds Request latency per endpoint.',
+                '# TYPE books_request_duration_seconds histogram',
+            ]
+            for (view, method), endpoint in endpoints:
+                labels = f'view="{view}",method="{method}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets, endpoint['buckets']):
+                    cumulative += count
+                    lines.append(f'books_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'books_request_duration_seconds_bucket{{{labels},le="+Inf"}} {endpoint["count"]}')
+                lines.append(f'books_request_duration_seconds_sum{{{labels}}} {endpoint["sum"]:.6f}')
+                lines.append(f'books_request_duration_seconds_count{{{labels}}} {endpoint["count"]}')
+            for name, key, help_text in (
+                    ('books_db_queries_total', 'queries', 'Database queries per endpoint.'),
+                    ('books_db_query_seconds_total', 'query_time', 'Time spent executing queries.'),
+                    ('books_serializer_seconds_total', 'serializer_time', 'Time spent in serializers.')):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for (view, method), endpoint in endpoints:
+                    value = endpoint[key]
+                    value = f'{value:.6f}' if isinstance(value, float) else value
+                    lines.append(f'{name}{{view="{view}",method="{method}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry(settings.BOOK_METRICS_BUCKETS)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_time += time.perf_counter() - started
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class SerializerTimingMixin:
+    # top-level serializers only, nested ones would be counted twice
+
+    def to_representation(self, instance):
+        stats = current_request.get()
+        if stats is None:
+            return super().to_representation(instance)
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_time += time.perf_counter() - started
+
+
+class serializer_timer:
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        stats = current_request.get()
+        if stats is not None:
+            stats.serializer_time += time.perf_counter() - self.started
+
+
+def endpoint_labels(request):
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match is not None else 'unmatched'
+    return view, request.method
+
+
+class MetricsMiddleware:
+    # Cheap enough to leave on: a few perf_counter() calls and one locked
+    # dict update per request. BOOK_PROFILE_SAMPLE_RATE of the sync requests
+    # are also run under cProfile and dumped to BOOK_PROFILE_DIR.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_request.set(stats)
+        profiler = self.start_profiler()
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            duration = time.perf_counter() - started
+            current_request.reset(token)
+            self.finish(request, duration, stats, profiler)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            duration = time.perf_counter() - started
+            current_request.reset(token)
+            self.finish(request, duration, stats)
+
+    def start_profiler(self):
+        if not settings.BOOK_PROFILE_DIR or random.random() >= settings.BOOK_PROFILE_SAMPLE_RATE:
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def finish(self, request, duration, stats, profiler=None):
+        labels = endpoint_labels(request)
+        if profiler is not None:
+            profiler.disable()
+            name = f'{labels[0]}-{labels[1]}-{time.time_ns()}-{os.getpid()}.prof'.replace('/', '_')
+            profiler.dump_stats(os.path.join(settings.BOOK_PROFILE_DIR, name))
+        if labels[0] != 'metrics':
+            registry.observe(labels, duration, stats)
+
+
+def metrics(request):
+    # off unless a token or scraper addresses are configured
+    token, allowed_ips = settings.BOOK_METRICS_TOKEN, settings.BOOK_METRICS_ALLOWED_IPS
+    if not token and not allowed_ips:
+        raise Http404
+    authorized = bool(token) and request.headers.get('Authorization') == f'Bearer {token}'
+    if not authorized and request.META.get('REMOTE_ADDR') not in allowed_ips:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:53
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Round
+
+
+def backfill_rating_stats(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+
+    def aggregate(expression):
+        return Subquery(
+            UserBookRelation.objects.filter(book=OuterRef('pk'))
+            .order_by().values('book').annotate(value=expression).values('value')
+        )
+
+    Book.objects.update(
+        rating_sum=Coalesce(aggregate(Sum('rate')), 0),
+        rating_count=Coalesce(aggregate(Count('rate')), 0),
+        rating=Round(aggregate(Avg('rate')), 2),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:54
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+
+    def count(**filters):
+        return Coalesce(Subquery(
+            UserBookRelation.objects.filter(book=OuterRef('pk'), **filters)
+            .order_by().values('book').annotate(value=Count('pk')).values('value')
+        ), 0)
+
+    Book.objects.update(
+        likes_count=count(like=True),
+        bookmarks_count=count(in_bookmarks=True),
+        readers_count=count(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_book_rating_sum_rating_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='bookmarks_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='readers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+FTS_TABLE = 'store_book_fts'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(name, author_name)')
+        schema_editor.execute(f'INSERT INTO {FTS_TABLE} (rowid, name, author_name) '
+                              f'SELECT id, name, author_name FROM store_book')
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX store_book_search_idx ON store_book USING GIN "
+            "(to_tsvector('simple', name || ' ' || author_name))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS store_book_search_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_book_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
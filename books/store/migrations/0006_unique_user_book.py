@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:59
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def dedupe_relations(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+
+    duplicates = (
+        UserBookRelation.objects.order_by().values('user', 'book')
+        .annotate(keep=Max('id'), relations=Count('id')).filter(relations__gt=1)
+    )
+    book_ids = set()
+    for duplicate in duplicates:
+        # the most recent relation reflects what the user asked for last
+        UserBookRelation.objects.filter(user=duplicate['user'], book=duplicate['book'],
+                                        id__lt=duplicate['keep']).delete()
+        book_ids.add(duplicate['book'])
+    if not book_ids:
+        return
+
+    def aggregate(expression, **filters):
+        return Subquery(
+            UserBookRelation.objects.filter(book=OuterRef('pk'), **filters)
+            .order_by().values('book').annotate(value=expression).values('value')
+        )
+
+    Book.objects.filter(pk__in=book_ids).update(
+        rating_sum=Coalesce(aggregate(Sum('rate')), 0),
+        rating_count=Coalesce(aggregate(Count('rate')), 0),
+        rating=aggregate(Avg('rate')),
+        likes_count=Coalesce(aggregate(Count('pk'), like=True), 0),
+        bookmarks_count=Coalesce(aggregate(Count('pk'), in_bookmarks=True), 0),
+        readers_count=Coalesce(aggregate(Count('pk')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_book_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_relations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userbookrelation',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='store_unique_user_book'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_pendingrating'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(fields=['book', 'like'], name='store_relation_book_like_idx'),
+        ),
+        # the composite index leads with book_id, the FK's own index goes afterwards
+        migrations.AlterField(
+            model_name='userbookrelation',
+            name='book',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='store.book'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_relation_book_like_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['rating', 'id'], name='store_book_rating_id_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_book_rating_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='userbookrelation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
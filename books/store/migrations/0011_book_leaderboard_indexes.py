@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['likes_count', 'id'], name='store_book_likes_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author_name', 'rating', 'id'], name='store_book_author_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author_name', 'likes_count', 'id'], name='store_book_author_likes_idx'),
+        ),
+    ]
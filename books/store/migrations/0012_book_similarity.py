@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_book_leaderboard_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('book', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.book')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='store.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['book', '-score', 'similar'], name='store_similarity_book_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, NullIf, Round
+
+
+def round_ratings(apps, schema_editor):
+    # ratings were stored with full float precision, while keyset cursors
+    # carry the value read back through DecimalField(3, 2)
+    Book = apps.get_model('store', 'Book')
+    Book.objects.filter(rating__isnull=False).update(
+        rating=Round(Cast(F('rating_sum'), FloatField()) / NullIf(F('rating_count'), Value(0)), 2),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_book_similarity'),
+    ]
+
+    operations = [
+        migrations.RunPython(round_ratings, migrations.RunPython.noop),
+    ]
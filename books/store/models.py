@@ -1,7 +1,9 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models.base import DEFERRED
+from django.utils import timezone
 
-from store.bookrelation import set_rating
+from store.bookrelation import update_book_stats
 
 
 class Book(models.Model):
@@ -11,6 +13,25 @@ class Book(models.Model):
     owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='my_books')
     readers = models.ManyToManyField(User, through='UserBookRelation', related_name='books')
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=None, null=True)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    likes_count = models.PositiveIntegerField(default=0)
+    bookmarks_count = models.PositiveIntegerField(default=0)
+    readers_count = models.PositiveIntegerField(default=0)
+    # also moved by the stats UPDATEs, see store.bookrelation
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # keyset pagination seeks on (ordering field, id)
+            models.Index(fields=['price', 'id'], name='store_book_price_id_idx'),
+            models.Index(fields=['author_name', 'id'], name='store_book_author_id_idx'),
+            models.Index(fields=['rating', 'id'], name='store_book_rating_id_idx'),
+            models.Index(fields=['likes_count', 'id'], name='store_book_likes_id_idx'),
+            # per-author leaderboards, walked from the top
+            models.Index(fields=['author_name', 'rating', 'id'], name='store_book_author_rating_idx'),
+            models.Index(fields=['author_name', 'likes_count', 'id'], name='store_book_author_likes_idx'),
+        ]
 
     def __str__(self):
         return f'Id: {self.id}: {self.name}, {self.author_name}'
@@ -26,21 +47,94 @@ class UserBookRelation(models.Model):
     )
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    # served by store_relation_book_like_idx, a separate book_id index would be redundant
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False)
     like = models.BooleanField(default=False)
     in_bookmarks = models.BooleanField(default=False)
     rate = models.PositiveSmallIntegerField(choices=RATE_CHOICES, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # also the index every (user, book) lookup is served from
+            models.UniqueConstraint(fields=['user', 'book'], name='store_unique_user_book'),
+        ]
+        indexes = [
+            # readers of a book and the per-book like counts
+            models.Index(fields=['book', 'like'], name='store_relation_book_like_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.username}: {self.book.name}, {self.rate}'
 
+    TRACKED_FIELDS = ('book_id', 'like', 'in_bookmarks', 'rate')
+
+    _loaded_values = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if all(loaded.get(name, DEFERRED) is not DEFERRED for name in cls.TRACKED_FIELDS):
+            instance._loaded_values = {name: loaded[name] for name in cls.TRACKED_FIELDS}
+        return instance
+
+    def tracked_values(self):
+        return {name: getattr(self, name) for name in self.TRACKED_FIELDS}
+
     def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            if not update_fields:
+                return
+            # auto_now only applies to the columns being written
+            kwargs['update_fields'] = [*update_fields, 'updated_at']
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            # the row is read again under a lock, so a concurrent save of the
+            # same relation waits for ours and takes its delta from what we
+            # wrote, not from the values both requests loaded; an instance
+            # with an explicit pk may UPDATE an existing row too
+            old = None
+            if self.pk is not None:
+                old = (type(self)._base_manager.using(using).select_for_update()
+                       .filter(pk=self.pk).values(*self.TRACKED_FIELDS).first())
+            super().save(*args, **kwargs)
+            new = self.tracked_values()
+            if old is not None and update_fields is not None:
+                # columns left out of update_fields still hold the stored value
+                saved = {self._meta.get_field(name).attname for name in update_fields}
+                new = {name: value if name in saved else old[name] for name, value in new.items()}
+
+            if old is None:
+                update_book_stats(self.book_id, None, new)
+            elif old['book_id'] != self.book_id:
+                update_book_stats(old['book_id'], old, None)
+                update_book_stats(self.book_id, None, new)
+            else:
+                update_book_stats(self.book_id, old, new)
+        self._loaded_values = new
 
-        old_rating = self.rate
-        creating = not self.pk
-        super().save()
 
-        new_rating = self.rate
-        if old_rating != new_rating: # or creating:
-            set_rating(self.book)
+class PendingRating(models.Model):
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True)
+    marked_at = models.DateTimeField(default=timezone.now, db_index=True)
 
+    def __str__(self):
+        return f'{self.book_id}: {self.marked_at}'
+
+
+class BookSimilarity(models.Model):
+    # top neighbours of each book, written by the compute_similar_books job
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+', db_index=False)
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='similar_to')
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            # a book's neighbours, best first, in one range scan
+            models.Index(fields=['book', '-score', 'similar'], name='store_similarity_book_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.book_id} ~ {self.similar_id}: {self.score:.3f}'
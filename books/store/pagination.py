@@ -0,0 +1,148 @@
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(field, value, pk, reverse=False):
+    cursor = {'f': field, 'v': value, 'id': pk, 'r': int(reverse)}
+    return b64encode(json.dumps(cursor, cls=DjangoJSONEncoder).encode('utf-8')).decode('ascii')
+
+
+class KeysetPagination(BasePagination):
+    # Cursor pagination over (ordering field, id). The ordering comes from the
+    # queryset, so it follows OrderingFilter; pages are fetched with a range
+    # predicate on the pair instead of OFFSET, so every page costs the same.
+    page_size = settings.BOOK_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    tiebreaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.get_page(list(self.get_page_queryset(queryset, request)))
+
+    def get_page_queryset(self, queryset, request):
+        # builds the query for one page without running it, so async views can await it
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.field, self.descending = self.get_ordering(queryset)
+        self.cursor = self.decode_cursor(request)
+        self.reverse = bool(self.cursor and self.cursor['r'])
+        self.current_page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.get_order_by(self.reverse))
+        if self.cursor is not None:
+            queryset = queryset.filter(self.get_position_filter(self.reverse))
+        return queryset[:self.current_page_size + 1]
+
+    def get_page(self, rows):
+        has_more = len(rows) > self.current_page_size
+        rows = rows[:self.current_page_size]
+        if self.reverse:
+            rows.reverse()
+
+        self.next_position = self.previous_position = None
+        if rows:
+            if has_more or self.reverse:
+                self.next_position = self.get_position(rows[-1])
+            if (has_more and self.reverse) or (self.cursor is not None and not self.reverse):
+                self.previous_position = self.get_position(rows[0])
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset):
+        ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        field = ordering[0] if ordering else self.tiebreaker
+        return field.lstrip('-'), field.startswith('-')
+
+    def get_order_by(self, reverse):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        if self.field == self.tiebreaker:
+            return [prefix + self.tiebreaker]
+        return [prefix + self.field, prefix + self.tiebreaker]
+
+    def get_position_filter(self, reverse):
+        lookup = 'lt' if self.descending != reverse else 'gt'
+        value, pk = self.cursor['v'], self.cursor['id']
+        if self.field == self.tiebreaker:
+            return Q(**{f'{self.tiebreaker}__{lookup}': pk})
+        # the leading inclusive bound keeps the predicate a range scan on (field, id)
+        return (Q(**{f'{self.field}__{lookup}e': value}) &
+                (Q(**{f'{self.field}__{lookup}': value}) | Q(**{f'{self.tiebreaker}__{lookup}': pk})))
+
+    def get_position(self, row):
+        if isinstance(row, dict):
+            return {'v': row[self.field], 'id': row[self.tiebreaker]}
+        return {'v': getattr(row, self.field), 'id': getattr(row, self.tiebreaker)}
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            if cursor['f'] != self.field or not isinstance(cursor['id'], int):
+                raise ValueError
+            return {'v': cursor['v'], 'id': cursor['id'], 'r': bool(cursor['r'])}
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse):
+        encoded = encode_cursor(self.field, position['v'], position['id'], reverse)
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+
+class ReadersPagination(CursorPagination):
+    ordering = 'id'
+    page_size = settings.BOOK_READERS_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        # readers are always paged by id, whatever ordering the book list uses
+        return (self.ordering,)
@@ -0,0 +1,76 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+# set per request by ReplicaRoutingMiddleware; commands, signals and tests
+# outside a request always stay on the primary
+replica_reads = ContextVar('books_replica_reads', default=False)
+
+PIN_COOKIE = 'books_primary'
+
+
+class ReplicaRouter:
+    # Reads of BOOK_REPLICA_APPS models in safe, unpinned requests go to one of
+    # BOOK_REPLICA_DATABASES, every write and every other read to the primary.
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.BOOK_REPLICA_DATABASES
+        if replicas and replica_reads.get() and model._meta.app_label in settings.BOOK_REPLICA_APPS:
+            return random.choice(replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # instances read from a replica are saved to the primary too
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.BOOK_REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    # After a successful write the client is pinned to the primary for
+    # BOOK_REPLICA_PIN_SECONDS with a cookie, so its next reads can't come
+    # from a replica that hasn't caught up with its own like or rate yet.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = replica_reads.set(self.use_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        token = replica_reads.set(self.use_replica(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        return self.pin(request, response)
+
+    def use_replica(self, request):
+        return (bool(settings.BOOK_REPLICA_DATABASES) and request.method in SAFE_METHODS and
+                PIN_COOKIE not in request.COOKIES)
+
+    def pin(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400 and settings.BOOK_REPLICA_DATABASES:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.BOOK_REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,105 @@
+from django.db import connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+FTS_TABLE = 'store_book_fts'
+PG_DOCUMENT = "to_tsvector('simple', \"store_book\".\"name\" || ' ' || \"store_book\".\"author_name\")"
+
+
+class SQLiteSearchBackend:
+    # FTS5 table keyed by book id, kept in sync from the Book signals
+
+    def match_query(self, terms):
+        # every term is quoted and prefix matched, so input can't inject FTS syntax
+        return ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+
+    def filter(self, queryset, terms):
+        query = self.match_query(terms)
+        # bm25 rank is negative, lower is more relevant
+        rank = RawSQL(
+            f'SELECT rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = "store_book"."id"',
+            [query], output_field=FloatField(),
+        )
+        matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [query])
+        return queryset.filter(pk__in=matches).annotate(search_rank=rank)
+
+    def index(self, cursor, book):
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [book.pk])
+        cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, name, author_name) VALUES (%s, %s, %s)',
+                       [book.pk, book.name, book.author_name])
+
+    def unindex(self, cursor, book_id):
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [book_id])
+
+    def rebuild(self, cursor):
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, name, author_name) '
+                       f'SELECT id, name, author_name FROM store_book')
+
+
+class PostgresSearchBackend:
+    # matches the GIN expression index created by the migration, so postgres
+    # maintains the index itself
+
+    def match_query(self, terms):
+        return ' & '.join("'%s':*" % term.replace('\\', '\\\\').replace("'", "''") for term in terms)
+
+    def filter(self, queryset, terms):
+        query = self.match_query(terms)
+        matches = RawSQL(f"{PG_DOCUMENT} @@ to_tsquery('simple', %s)", [query], output_field=BooleanField())
+        rank = RawSQL(f"-ts_rank({PG_DOCUMENT}, to_tsquery('simple', %s))", [query], output_field=FloatField())
+        return queryset.filter(matches).annotate(search_rank=rank)
+
+    def index(self, cursor, book):
+        pass
+
+    def unindex(self, cursor, book_id):
+        pass
+
+    def rebuild(self, cursor):
+        pass
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend(),
+    'postgresql': PostgresSearchBackend(),
+}
+
+
+def get_backend(using='default'):
+    return BACKENDS.get(connections[using].vendor)
+
+
+def index_book(book, using='default'):
+    backend = get_backend(using)
+    if backend is not None:
+        with connections[using].cursor() as cursor:
+            backend.index(cursor, book)
+
+
+def unindex_book(book_id, using='default'):
+    backend = get_backend(using)
+    if backend is not None:
+        with connections[using].cursor() as cursor:
+            backend.unindex(cursor, book_id)
+
+
+def rebuild_search_index(using='default'):
+    backend = get_backend(using)
+    if backend is not None:
+        with connections[using].cursor() as cursor:
+            backend.rebuild(cursor)
+
+
+class BookSearchFilter(SearchFilter):
+    # answers ?search= from the full-text index and ranks by relevance,
+    # falling back to icontains on databases without a backend
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        backend = get_backend(queryset.db)
+        if not terms or backend is None:
+            return super().filter_queryset(request, queryset, view)
+        # OrderingFilter runs afterwards and wins when ?ordering= is given
+        return backend.filter(queryset, terms).order_by('search_rank')
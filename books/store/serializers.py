@@ -1,7 +1,11 @@
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
 
+from store.metrics import SerializerTimingMixin, serializer_timer
 from store.models import Book, UserBookRelation
 
 
@@ -11,23 +15,150 @@ class BookReaderSerializer(ModelSerializer):
         fields = ('first_name', 'last_name')
 
 
-class BooksSerializer(ModelSerializer):
-    # likes_count = serializers.SerializerMethodField()
-    annotated_likes = serializers.IntegerField(read_only=True)
+class BooksSerializer(SerializerTimingMixin, ModelSerializer):
+    annotated_likes = serializers.IntegerField(source='likes_count', read_only=True)
     rating = serializers.DecimalField(max_digits=3, decimal_places=2, read_only=True)
     owner_name = serializers.CharField(read_only=True)
-    readers = BookReaderSerializer(many=True, read_only=True)
+    readers = serializers.SerializerMethodField()
+    my_relation = serializers.SerializerMethodField()
 
     class Meta:
         model = Book
-        # fields = ('id', 'name', 'price', 'author_name', 'likes_count', 'annotated_likes', 'rating')
-        fields = ('id', 'name', 'price', 'author_name', 'annotated_likes', 'rating', 'owner_name', 'readers')
+        fields = ('id', 'name', 'price', 'author_name', 'annotated_likes', 'bookmarks_count', 'readers_count',
+                  'rating', 'owner_name', 'readers', 'my_relation')
+        read_only_fields = ('bookmarks_count', 'readers_count')
 
-    def get_likes_count(self, instance):
-            return UserBookRelation.objects.filter(book=instance, like=True).count()
+    def get_fields(self):
+        fields = super().get_fields()
+        # only when the view annotated the requesting user's relation
+        if not self.context.get('my_relation'):
+            fields.pop('my_relation')
+        return fields
 
+    def get_readers(self, instance):
+        # the views prefetch the preview per book, otherwise query it here
+        readers = getattr(instance, 'readers_preview', None)
+        if readers is None:
+            readers = instance.readers.order_by('id')[:settings.BOOK_READERS_PREVIEW_SIZE]
+        return BookReaderSerializer(readers, many=True).data
 
-class UserBookRelationSerializer(ModelSerializer):
+    def get_my_relation(self, instance):
+        return my_relation_data(instance.my_like, instance.my_in_bookmarks, instance.my_rate)
+
+
+def my_relation_data(like, in_bookmarks, rate):
+    # books the user never touched have no relation row, the defaults apply
+    return {'like': bool(like), 'in_bookmarks': bool(in_bookmarks), 'rate': rate}
+
+
+class FastBooksSerializer:
+    # Opt-in stand-in for BooksSerializer(many=True) on list pages (BOOK_FAST_SERIALIZER).
+    # Rows come from .values() and the readers preview from one query per page;
+    # only the decimals go through the DRF fields, so the rendered JSON is identical.
+    values = ('id', 'name', 'price', 'author_name', 'likes_count', 'bookmarks_count', 'readers_count',
+              'rating', 'owner_name')
+
+    def __init__(self, rows, my_relation=False):
+        self.rows = rows
+        self.my_relation = my_relation
+
+    @classmethod
+    def get_rows(cls, queryset, *extra):
+        # prefetches can't attach to dicts, the readers are loaded in get_readers()
+        extra = [field for field in extra if field not in cls.values]
+        return queryset.prefetch_related(None).values(*cls.values, *extra)
+
+    def get_readers_queryset(self, book_ids):
+        return UserBookRelation.objects.filter(book_id__in=book_ids).annotate(
+            position=Window(RowNumber(), partition_by=F('book_id'), order_by=F('user_id').asc()),
+        ).filter(position__lte=settings.BOOK_READERS_PREVIEW_SIZE).order_by('book_id', 'user_id').values_list(
+            'book_id', 'user__first_name', 'user__last_name')
+
+    @staticmethod
+    def group_readers(rows):
+        readers = {}
+        for book_id, first_name, last_name in rows:
+            readers.setdefault(book_id, []).append({'first_name': first_name, 'last_name': last_name})
+        return readers
+
+    def get_readers(self, book_ids):
+        if not book_ids:
+            return {}
+        return self.group_readers(self.get_readers_queryset(book_ids))
+
+    async def aget_readers(self, book_ids):
+        if not book_ids:
+            return {}
+        return self.group_readers([row async for row in self.get_readers_queryset(book_ids)])
+
+    @property
+    def data(self):
+        with serializer_timer():
+            return self.get_data(self.get_readers([row['id'] for row in self.rows]))
+
+    async def adata(self):
+        # .data for async views, the readers query is awaited
+        readers = await self.aget_readers([row['id'] for row in self.rows])
+        with serializer_timer():
+            return self.get_data(readers)
+
+    def get_data(self, readers):
+        fields = BooksSerializer().fields
+        price, rating = fields['price'].to_representation, fields['rating'].to_representation
+        data = [{
+            'id': row['id'],
+            'name': row['name'],
+            'price': price(row['price']),
+            'author_name': row['author_name'],
+            'annotated_likes': row['likes_count'],
+            'bookmarks_count': row['bookmarks_count'],
+            'readers_count': row['readers_count'],
+            'rating': None if row['rating'] is None else rating(row['rating']),
+            'owner_name': row['owner_name'],
+            'readers': readers.get(row['id'], []),
+        } for row in self.rows]
+        if self.my_relation:
+            for book, row in zip(data, self.rows):
+                book['my_relation'] = my_relation_data(row['my_like'], row['my_in_bookmarks'], row['my_rate'])
+        return data
+
+
+class UserBookRelationSerializer(SerializerTimingMixin, ModelSerializer):
     class Meta:
         model = UserBookRelation
         fields = ('id', 'book', 'like', 'in_bookmarks', 'rate')
+
+    def update(self, instance, validated_data):
+        if instance._state.adding:
+            return super().update(instance, validated_data)
+        # only changed columns are written; an unchanged PATCH issues no UPDATE at all
+        changed = []
+        for field, value in validated_data.items():
+            attname = instance._meta.get_field(field).attname
+            if getattr(instance, attname) != getattr(value, 'pk', value):
+                changed.append(field)
+        for field in changed:
+            setattr(instance, field, validated_data[field])
+        instance.save(update_fields=changed)
+        return instance
+
+
+class UserBookRelationBulkListSerializer(serializers.ListSerializer):
+    def validate(self, items):
+        book_ids = [item['book'] for item in items]
+        if len(set(book_ids)) != len(book_ids):
+            raise serializers.ValidationError('Each book may appear only once.')
+        missing = set(book_ids) - set(Book.objects.filter(pk__in=book_ids).values_list('pk', flat=True))
+        if missing:
+            raise serializers.ValidationError(f'Unknown books: {sorted(missing)}')
+        return items
+
+
+class UserBookRelationBulkSerializer(serializers.Serializer):
+    book = serializers.IntegerField(min_value=1)
+    like = serializers.BooleanField(required=False)
+    in_bookmarks = serializers.BooleanField(required=False)
+    rate = serializers.ChoiceField(choices=UserBookRelation.RATE_CHOICES, required=False, allow_null=True)
+
+    class Meta:
+        list_serializer_class = UserBookRelationBulkListSerializer
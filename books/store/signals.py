@@ -0,0 +1,45 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from store.bookrelation import update_book_stats
+from store.cache import invalidate_books
+from store.database import configure_connection
+from store.metrics import install_query_recorder
+from store.models import Book, UserBookRelation
+from store.search import index_book, unindex_book
+
+SEARCH_FIELDS = {'name', 'author_name'}
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, update_fields=None, using='default', **kwargs):
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        index_book(instance, using)
+    invalidate_books(instance.pk)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, using='default', **kwargs):
+    unindex_book(instance.pk, using)
+    invalidate_books(instance.pk)
+
+
+@receiver(post_save, sender=UserBookRelation)
+def relation_saved(sender, instance, **kwargs):
+    invalidate_books(instance.book_id)
+
+
+@receiver(post_delete, sender=UserBookRelation)
+def relation_deleted(sender, instance, origin=None, **kwargs):
+    # relations cascading from a deleted book leave nothing to update
+    if isinstance(origin, Book) or getattr(origin, 'model', None) is Book:
+        return
+    update_book_stats(instance.book_id, instance._loaded_values or instance.tracked_values(), None)
+    invalidate_books(instance.book_id)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    configure_connection(connection)
+    install_query_recorder(connection)
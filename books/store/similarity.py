@@ -0,0 +1,77 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from scipy import sparse
+
+from store.models import Book, BookSimilarity, UserBookRelation
+
+
+def load_matrix():
+    # readers x books, 1 where the reader liked or rated the book highly
+    pairs = UserBookRelation.objects.filter(
+        Q(like=True) | Q(rate__gte=settings.BOOK_SIMILAR_MIN_RATE)).values_list('user_id', 'book_id')
+    pairs = np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+    user_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    book_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix((np.ones(len(pairs), dtype=np.float32), (rows, columns)),
+                               shape=(len(user_ids), len(book_ids)))
+    return matrix, book_ids
+
+
+def top_neighbours(matrix, book_ids, targets=None, top_k=20, min_common=2, chunk_size=1000):
+    # Cosine similarity of the book columns. The co-occurrence counts of a chunk
+    # of books against all others come from one sparse product, so memory
+    # stays at chunk_size rows whatever the size of the catalog.
+    by_user = matrix.tocsc()
+    by_book = by_user.T.tocsr()
+    # the matrix is binary, a column's norm is the square root of its readers
+    norms = np.sqrt(np.asarray(by_user.sum(axis=0)).ravel())
+    positions = np.arange(len(book_ids)) if targets is None else np.flatnonzero(np.isin(book_ids, targets))
+    for start in range(0, len(positions), chunk_size):
+        chunk = positions[start:start + chunk_size]
+        common = (by_book[chunk] @ by_user).tocsr()
+        for row, position in enumerate(chunk):
+            begin, end = common.indptr[row], common.indptr[row + 1]
+            neighbours, counts = common.indices[begin:end], common.data[begin:end]
+            keep = (neighbours != position) & (counts >= min_common)
+            neighbours, counts = neighbours[keep], counts[keep]
+            scores = counts / (norms[position] * norms[neighbours])
+            if len(scores) > top_k:
+                best = np.argpartition(-scores, top_k - 1)[:top_k]
+                neighbours, scores = neighbours[best], scores[best]
+            order = np.lexsort((book_ids[neighbours], -scores))
+            yield int(book_ids[position]), [(int(book_ids[neighbour]), float(score))
+                                            for neighbour, score in zip(neighbours[order], scores[order])]
+
+
+def compute_similar_books(since=None, top_k=None, min_common=None, batch_size=5000):
+    # since: only the books whose stats changed from then on get new neighbours,
+    # the lists of other books that show them are refreshed by the next full run
+    top_k = top_k or settings.BOOK_SIMILAR_TOP_K
+    min_common = min_common or settings.BOOK_SIMILAR_MIN_COMMON
+    targets = None
+    if since is not None:
+        targets = list(Book.objects.filter(updated_at__gte=since).values_list('id', flat=True))
+        if not targets:
+            return 0, 0
+    matrix, book_ids = load_matrix()
+
+    books = stored = 0
+    with transaction.atomic():
+        stale = BookSimilarity.objects.all()
+        if targets is not None:
+            stale = stale.filter(book_id__in=targets)
+        stale.delete()
+        batch = []
+        for book_id, neighbours in top_neighbours(matrix, book_ids, targets, top_k, min_common):
+            books += 1
+            batch.extend(BookSimilarity(book_id=book_id, similar_id=similar_id, score=score)
+                         for similar_id, score in neighbours)
+            if len(batch) >= batch_size:
+                BookSimilarity.objects.bulk_create(batch)
+                stored += len(batch)
+                batch = []
+        BookSimilarity.objects.bulk_create(batch)
+        stored += len(batch)
+    return books, stored
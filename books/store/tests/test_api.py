@@ -1,10 +1,13 @@
 import json
 import os
+import time
+from unittest import mock
 
 from django.contrib.auth.models import User
-from django.db import connection
-from django.db.models import Count, Case, When, Avg, F
+from django.db import connection, IntegrityError, transaction
+from django.db.models import F
 from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
 from rest_framework.exceptions import ErrorDetail
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "books.settings")
@@ -15,6 +18,7 @@ from rest_framework.test import APITestCase
 
 from store.models import Book, UserBookRelation
 from store.serializers import BooksSerializer
+from store.views import UserBookRelationViewSet
 
 
 class BooksApiTestCase(APITestCase):
@@ -36,14 +40,13 @@ class BooksApiTestCase(APITestCase):
         url = reverse('book-list')
         with CaptureQueriesContext(connection) as queries:
             response = self.client.get(url)
-            self.assertEqual(2, len(queries))
+            self.assertEqual(3, len(queries))
         books = Book.objects.all().annotate(
-            annotated_likes=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name=F('owner__username')
         ).order_by('id')
         serializer_data = BooksSerializer(books, many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
         self.assertEqual(serializer_data[1]['rating'], '5.00')
         # self.assertEqual(serializer_data[0]['likes_count'], 1)
         self.assertEqual(serializer_data[1]['annotated_likes'], 1)
@@ -52,60 +55,193 @@ class BooksApiTestCase(APITestCase):
     def test_get_filter(self):
         url = reverse('book-list')
         books = Book.objects.filter(price=55).annotate(
-            annotated_likes=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name=F('owner__username')
         )
         response = self.client.get(url, data={'price': 55})
         serializer_data = BooksSerializer(books, many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
 
     def test_get_search(self):
         url = reverse('book-list')
         books = Book.objects.filter(id__in=[self.book_1.id, self.book_3.id]).annotate(
-            annotated_likes=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name=F('owner__username'),
             # rating=Avg('userbookrelation__rate')
-        )
+        ).order_by('-id')
+        # book 3 matches both terms in its name as well as its author, so it ranks first
         response = self.client.get(url, data={'search': 'Author 1'})
         serializer_data = BooksSerializer(books, many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
         # print(serializer_data, sep='\n')
         # print(response.data, sep='\n')
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
+
+    def test_get_search_index(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'search': 'writ'})
+        self.assertEqual([], response.data['results'])
+
+        book = Book.objects.create(name='Another book', price=10, author_name='Writer X')
+        self.book_4.author_name = 'Writer Y'
+        self.book_4.save()
+        response = self.client.get(url, data={'search': 'writ', 'ordering': 'price'})
+        self.assertEqual([book.id, self.book_4.id], [book['id'] for book in response.data['results']])
+
+        book.delete()
+        response = self.client.get(url, data={'search': 'writ'})
+        self.assertEqual([self.book_4.id], [book['id'] for book in response.data['results']])
+
+        response = self.client.get(url, data={'search': '"book -'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
 
     def test_get_ordering_ascending(self):
         url = reverse('book-list')
         books = Book.objects.all().annotate(
-            annotated_likes=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name=F('owner__username')
-        ).order_by('author_name').select_related('owner')
+        ).order_by('author_name', 'id').select_related('owner')
         response = self.client.get(url, data={'ordering': 'author_name'})
         serializer_data = BooksSerializer(books, many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
 
     def test_get_ordering_descending(self):
         url = reverse('book-list')
         books = Book.objects.all().annotate(
-            annotated_likes=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name=F('owner__username'),
             #rating=Avg('userbookrelation__rate')
-        ).select_related('owner').order_by('-author_name')
+        ).select_related('owner').order_by('-author_name', '-id')
         response = self.client.get(url, data={'ordering': '-author_name'})
         serializer_data = BooksSerializer(books, many=True).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
-
-    # def test_get_price_range(self):
-    #     url = reverse('book-list')
-    #     books = Book.objects.filter(price__gte=20, price__lte=60).annotate(
-    #         annotated_likes=Count(Case(When(userbookrelation__like=True, then=1)))
-    #     )
-    #     response = self.client.get(url, data={'min_price': '20', 'max_price': '60'})
-    #     serializer_data = BooksSerializer(books, many=True).data
-    #     self.assertEqual(status.HTTP_200_OK, response.status_code)
-    #     self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
+
+    def test_get_pages(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'ordering': '-price', 'page_size': 2})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([self.book_3.id, self.book_4.id], [book['id'] for book in response.data['results']])
+        self.assertIsNone(response.data['previous'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([self.book_2.id, self.book_1.id], [book['id'] for book in response.data['results']])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([self.book_3.id, self.book_4.id], [book['id'] for book in response.data['results']])
+        self.assertIsNone(response.data['previous'])
+
+    def test_get_ordering_rating(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book_3, rate=4)
+        UserBookRelation.objects.create(user=self.staff_user, book=self.book_3, rate=5)
+        url = reverse('book-list')
+        response = self.client.get(url, data={'ordering': '-rating', 'page_size': 1})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([self.book_2.id], [book['id'] for book in response.data['results']])
+        response = self.client.get(response.data['next'])
+        # unrated books are left out of the ranking
+        self.assertEqual([self.book_3.id], [book['id'] for book in response.data['results']])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(url, data={'ordering': '-likes_count,-id'})
+        self.assertEqual([self.book_2.id, self.book_4.id, self.book_3.id, self.book_1.id],
+                         [book['id'] for book in response.data['results']])
+
+    def test_get_ordering_several_fields(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'ordering': 'author_name,-price'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('ordering', response.data)
+
+    def test_get_ordering_rating_pages(self):
+        # 14/3 doesn't terminate, the stored rating must match the cursor's 4.67
+        users = [self.user, self.staff_user, User.objects.create_user(username='test_user_3')]
+        for i in range(2):
+            Book.objects.create(name=f'Test book {5 + i}', price=30, author_name='Author 4')
+        for book in Book.objects.all():
+            for user, rate in zip(users, (5, 5, 4)):
+                UserBookRelation.objects.update_or_create(user=user, book=book, defaults={'rate': rate})
+        ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+
+        for ordering, expected in (('-rating', ids[::-1]), ('rating', ids)):
+            with self.subTest(ordering=ordering):
+                page = self.client.get(reverse('book-list'), data={'ordering': ordering, 'page_size': 2}).json()
+                seen = [book['id'] for book in page['results']]
+                while page['next'] and len(seen) <= len(ids):
+                    page = self.client.get(page['next']).json()
+                    seen += [book['id'] for book in page['results']]
+                self.assertEqual(expected, seen)
+
+    def test_top(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book_3, rate=4, like=True)
+        UserBookRelation.objects.create(user=self.staff_user, book=self.book_3, rate=3, like=True)
+        UserBookRelation.objects.create(user=self.staff_user, book=self.book_1, rate=5)
+        url = reverse('book-top')
+        response = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        books = Book.objects.annotate(owner_name=F('owner__username')).filter(
+            id__in=[self.book_1.id, self.book_2.id, self.book_3.id]).order_by('-rating', '-id')
+        self.assertEqual(BooksSerializer(books, many=True).data, response.data)
+
+        response = self.client.get(url, data={'by': 'likes'})
+        self.assertEqual([self.book_3.id, self.book_2.id], [book['id'] for book in response.data])
+        response = self.client.get(url, data={'by': 'rating', 'author_name': 'Author 1', 'limit': 1})
+        self.assertEqual([self.book_1.id], [book['id'] for book in response.data])
+
+        # kept current by the relation writes
+        UserBookRelation.objects.create(user=self.staff_user, book=self.book_4, like=True)
+        UserBookRelation.objects.create(user=self.user, book=self.book_4, like=True)
+        UserBookRelation.objects.filter(book=self.book_3, user=self.user).delete()
+        response = self.client.get(url, data={'by': 'likes'})
+        self.assertEqual([self.book_4.id, self.book_3.id, self.book_2.id], [book['id'] for book in response.data])
+
+        response = self.client.get(url, data={'by': 'price'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_get_pages_invalid_cursor(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'cursor': 'garbage'})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_get_price_range(self):
+        url = reverse('book-list')
+        books = Book.objects.filter(price__gte=20, price__lte=60).annotate(
+            owner_name=F('owner__username')
+        ).order_by('id')
+        response = self.client.get(url, data={'min_price': '20', 'max_price': '60'})
+        serializer_data = BooksSerializer(books, many=True).data
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(serializer_data, response.data['results'])
+
+    def test_get_filters(self):
+        url = reverse('book-list')
+        UserBookRelation.objects.create(user=self.user, book=self.book_3, in_bookmarks=True, rate=3)
+        UserBookRelation.objects.create(user=self.staff_user, book=self.book_4, like=True, rate=4)
+        cases = [
+            ({'min_rating': '4'}, [self.book_2, self.book_4]),
+            ({'min_rating': '3', 'max_rating': '4.5'}, [self.book_3, self.book_4]),
+            ({'author_name': 'Author 1'}, [self.book_1, self.book_3]),
+            ({'author_name': 'Author'}, []),
+            ({'author_prefix': 'Author'}, [self.book_1, self.book_2, self.book_3, self.book_4]),
+            ({'author_prefix': 'Author 3'}, [self.book_4]),
+            ({'liked_by_me': 'true'}, []),
+            ({'bookmarked_by_me': 'true'}, []),
+        ]
+        for params, books in cases:
+            response = self.client.get(url, data=params)
+            self.assertEqual([book.id for book in books], [book['id'] for book in response.data['results']], params)
+
+        self.client.force_login(self.user)
+        cases = [
+            ({'liked_by_me': 'true'}, [self.book_2]),
+            ({'liked_by_me': 'false'}, [self.book_1, self.book_3, self.book_4]),
+            ({'bookmarked_by_me': 'true', 'min_price': '60'}, [self.book_3]),
+        ]
+        for params, books in cases:
+            response = self.client.get(url, data=params)
+            self.assertEqual([book.id for book in books], [book['id'] for book in response.data['results']], params)
+
+        response = self.client.get(url, data={'min_rating': 'high'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
 
     def test_create(self):
         self.assertEqual(4, Book.objects.all().count())
@@ -140,6 +276,22 @@ class BooksApiTestCase(APITestCase):
 
         # попытка изменения чужой записи
 
+    def test_update_queries(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.patch(url, data=json.dumps({'price': 30}), content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('30.00', response.data['price'])
+        self.assertEqual('test_user', response.data['owner_name'])
+        queries = [query['sql'] for query in captured.captured_queries]
+        update = next(i for i, sql in enumerate(queries) if sql.startswith('UPDATE "store_book"'))
+        # the object is fetched without joins or prefetches, the owner is never loaded
+        self.assertEqual(1, len([sql for sql in queries[:update] if 'FROM "store_book"' in sql]))
+        self.assertNotIn('JOIN', queries[update - 1])
+        self.assertNotIn('likes_count', queries[update])
+        self.assertEqual(1, len([sql for sql in queries[:update] if 'FROM "auth_user"' in sql]))
+
     def test_update_not_owner(self):
         url = reverse('book-detail', args=(self.book_2.id,))
         data = {
@@ -194,6 +346,201 @@ class BooksApiTestCase(APITestCase):
         self.book_2.refresh_from_db()
         self.assertEqual(500, self.book_2.price)
 
+    def test_get_readers_preview(self):
+        for i in range(6):
+            reader = User.objects.create_user(username=f'reader_{i}', first_name=f'Reader {i}')
+            UserBookRelation.objects.create(user=reader, book=self.book_1)
+        url = reverse('book-detail', args=(self.book_1.id,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            self.assertEqual(3, len(queries))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(6, response.data['readers_count'])
+        self.assertEqual([f'Reader {i}' for i in range(5)],
+                         [reader['first_name'] for reader in response.data['readers']])
+
+        # read per request, the same for the standard and the fast serializer
+        with self.settings(BOOK_READERS_PREVIEW_SIZE=2):
+            response = self.client.get(reverse('book-list'), data={'search': 'Test book 1'})
+            self.assertEqual(['Reader 0', 'Reader 1'],
+                             [reader['first_name'] for reader in response.data['results'][0]['readers']])
+            with self.settings(BOOK_FAST_SERIALIZER=True):
+                response = self.client.get(reverse('book-list'), data={'search': 'Test book 1', 'page_size': 1})
+            self.assertEqual(['Reader 0', 'Reader 1'],
+                             [reader['first_name'] for reader in response.data['results'][0]['readers']])
+
+    def test_get_readers(self):
+        for i in range(3):
+            reader = User.objects.create_user(username=f'reader_{i}', first_name=f'Reader {i}')
+            UserBookRelation.objects.create(user=reader, book=self.book_1)
+        url = reverse('book-readers', args=(self.book_1.id,))
+        response = self.client.get(url, data={'page_size': 2})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([{'first_name': 'Reader 0', 'last_name': ''}, {'first_name': 'Reader 1', 'last_name': ''}],
+                         response.data['results'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([{'first_name': 'Reader 2', 'last_name': ''}], response.data['results'])
+        self.assertIsNone(response.data['next'])
+
+    def test_export(self):
+        url = reverse('book-export')
+        with self.settings(BOOK_EXPORT_CHUNK_SIZE=2):
+            response = self.client.get(url, data={'ordering': '-price'})
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertTrue(response.streaming)
+            lines = b''.join(response.streaming_content).splitlines()
+        books = Book.objects.all().annotate(
+            owner_name=F('owner__username')
+        ).order_by('-price', '-id')
+        self.assertEqual(BooksSerializer(books, many=True).data, [json.loads(line) for line in lines])
+
+        response = self.client.get(url, data={'file_format': 'csv', 'search': 'Author 1', 'ordering': 'price'})
+        self.assertEqual('text/csv', response['Content-Type'])
+        self.assertEqual([
+            'id,name,price,author_name,annotated_likes,bookmarks_count,readers_count,rating,owner_name,readers',
+            f'{self.book_1.id},Test book 1,25.00,Author 1,0,0,0,,test_user,',
+            f'{self.book_3.id},Test book 3 Author 1,65.00,Author 1,0,0,0,,,',
+        ], b''.join(response.streaming_content).decode().splitlines())
+
+    def test_export_wrong_format(self):
+        response = self.client.get(reverse('book-export'), data={'file_format': 'xml'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_get_fast(self):
+        url = reverse('book-list')
+        expected = self.client.get(url, data={'ordering': '-price', 'page_size': 2})
+        with self.settings(BOOK_FAST_SERIALIZER=True,
+                           CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            response = self.client.get(url, data={'ordering': '-price', 'page_size': 2})
+            self.assertEqual(expected.content, response.content)
+            response = self.client.get(response.data['next'])
+        self.assertEqual([self.book_2.id, self.book_1.id], [book['id'] for book in response.data['results']])
+
+    def test_get_my_relation(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book_3, in_bookmarks=True)
+        UserBookRelation.objects.create(user=self.staff_user, book=self.book_1, like=True, rate=1)
+        url = reverse('book-list')
+        self.client.force_login(self.user)
+        # session, user, validators, books with the user's relations joined, readers
+        with self.assertNumQueries(5):
+            response = self.client.get(url, data={'my_relation': 'true'})
+        self.assertEqual([
+            {'like': False, 'in_bookmarks': False, 'rate': None},
+            {'like': True, 'in_bookmarks': False, 'rate': 5},
+            {'like': False, 'in_bookmarks': True, 'rate': None},
+            {'like': False, 'in_bookmarks': False, 'rate': None},
+        ], [book['my_relation'] for book in response.data['results']])
+        with self.assertNumQueries(5):
+            response = self.client.get(url, data={'my_relation': 'true', 'page_size': 2})
+        self.assertEqual(2, len(response.data['results']))
+
+        response = self.client.get(reverse('book-detail', args=(self.book_2.id,)), data={'my_relation': 'true'})
+        self.assertEqual({'like': True, 'in_bookmarks': False, 'rate': 5}, response.data['my_relation'])
+
+        expected = self.client.get(url, data={'my_relation': 'true'})
+        with self.settings(BOOK_FAST_SERIALIZER=True,
+                           CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            fast = self.client.get(url, data={'my_relation': 'true'})
+        self.assertEqual(expected.content, fast.content)
+
+        # cached per user, and never for anonymous requests
+        self.client.force_login(self.staff_user)
+        response = self.client.get(url, data={'my_relation': 'true'})
+        self.assertEqual({'like': True, 'in_bookmarks': False, 'rate': 1}, response.data['results'][0]['my_relation'])
+        self.client.logout()
+        response = self.client.get(url, data={'my_relation': 'true'})
+        self.assertNotIn('my_relation', response.data['results'][0])
+
+    def test_get_conditional(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'page_size': 2})
+        etag = response['ETag']
+        # a page can lose its newest book, its Last-Modified could go back in time
+        self.assertFalse(response.has_header('Last-Modified'))
+        response = self.client.get(url, data={'page_size': 2}, HTTP_IF_MODIFIED_SINCE=http_date(time.time()))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        # validators are cached with the response, a revalidation costs nothing
+        with self.assertNumQueries(0):
+            response = self.client.get(url, data={'page_size': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEqual(etag, response['ETag'])
+        self.assertEqual(b'', response.content)
+        response = self.client.get(url, data={'page_size': 3}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        # a change on another page leaves this one valid, without the cache it takes one query
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.book_4.name = 'Test book 4, 2nd edition'
+            self.book_4.save()
+            with self.assertNumQueries(1):
+                response = self.client.get(url, data={'page_size': 2}, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+        UserBookRelation.objects.create(user=self.staff_user, book=self.book_1, like=True)
+        response = self.client.get(url, data={'page_size': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+        etag = response['ETag']
+
+        self.book_2.delete()
+        response = self.client.get(url, data={'page_size': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_get_conditional_detail(self):
+        url = reverse('book-detail', args=(self.book_2.id,))
+        response = self.client.get(url)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+        self.client.force_login(self.user)
+        url = reverse('userbookrelation-detail', args=(self.book_2.id,))
+        self.client.patch(url, data=json.dumps({'rate': 4}), content_type='application/json')
+        response = self.client.get(reverse('book-detail', args=(self.book_2.id,)), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('4.00', response.data['rating'])
+
+        response = self.client.get(reverse('book-detail', args=(1000,)), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_get_cached(self):
+        url = reverse('book-list')
+        response = self.client.get(url)
+        self.assertEqual('MISS', response['X-Cache'])
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(url)
+            self.assertEqual(0, len(queries))
+        self.assertEqual('HIT', cached['X-Cache'])
+        self.assertEqual(response.content, cached.content)
+
+        UserBookRelation.objects.create(user=self.staff_user, book=self.book_1, like=True)
+        response = self.client.get(url)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual(1, response.data['results'][0]['annotated_likes'])
+
+    def test_get_cached_detail(self):
+        url_1 = reverse('book-detail', args=(self.book_1.id,))
+        url_2 = reverse('book-detail', args=(self.book_2.id,))
+        self.client.get(url_1)
+        self.client.get(url_2)
+
+        self.book_2.price = 60
+        self.book_2.save()
+        self.assertEqual('HIT', self.client.get(url_1)['X-Cache'])
+        response = self.client.get(url_2)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual('60.00', response.data['price'])
+
+        # the same book behind a non-canonical pk is invalidated with it
+        url_2_padded = f'/book/0{self.book_2.id}/'
+        self.assertEqual('60.00', self.client.get(url_2_padded).json()['price'])
+        self.book_2.price = 99
+        self.book_2.save()
+        self.assertEqual('99.00', self.client.get(url_2_padded).json()['price'])
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get('/book/abc/').status_code)
+
 
 class UserBookRelationTestCase(APITestCase):
     def setUp(self):
@@ -257,3 +604,106 @@ class UserBookRelationTestCase(APITestCase):
         self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
         self.assertEqual({'rate': [ErrorDetail(string='"6" is not a valid choice.', code='invalid_choice')]},
                           response.data)
+
+    def test_rate_queries(self):
+        url = reverse('userbookrelation-detail', args=(self.book_2.id,))
+        self.client.force_login(self.user)
+        # session, user, relation lookup, book check, savepoint, INSERT, book UPDATE, release
+        with self.assertNumQueries(8):
+            response = self.client.patch(url, data=json.dumps({'rate': 3}), content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        # session, user, relation lookup, savepoint, locked re-read, UPDATE rate only, book UPDATE, release
+        with self.assertNumQueries(8):
+            response = self.client.patch(url, data=json.dumps({'rate': 4}), content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        # nothing changed, nothing written
+        with self.assertNumQueries(3):
+            response = self.client.patch(url, data=json.dumps({'rate': 4}), content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.book_2.refresh_from_db()
+        self.assertEqual((4, 1, 1), (self.book_2.rating_sum, self.book_2.rating_count, self.book_2.readers_count))
+
+    def test_rate_unknown_book(self):
+        url = reverse('userbookrelation-detail', args=(1000,))
+        self.client.force_login(self.user)
+        response = self.client.patch(url, data=json.dumps({'rate': 3}), content_type='application/json')
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_unique_relation(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book_2)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            UserBookRelation.objects.create(user=self.user, book=self.book_2)
+
+    def test_rate_concurrent_create(self):
+        url = reverse('userbookrelation-detail', args=(self.book_2.id,))
+        self.client.force_login(self.user)
+        # another request creates the relation after this one found none
+        stale = UserBookRelation(user=self.user, book=self.book_2)
+        UserBookRelation.objects.create(user=self.user, book=self.book_2, like=True)
+        with mock.patch.object(UserBookRelationViewSet, 'get_object', return_value=stale):
+            response = self.client.patch(url, data=json.dumps({'rate': 4}), content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book_2)
+        self.assertEqual((True, 4), (relation.like, relation.rate))
+        self.book_2.refresh_from_db()
+        self.assertEqual((1, 1, 4), (self.book_2.readers_count, self.book_2.likes_count, self.book_2.rating_sum))
+
+    def test_bulk(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True, rate=2)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_2, rate=5)
+        url = reverse('userbookrelation-bulk')
+        self.client.force_login(self.user)
+        data = [
+            {'book': self.book_1.id, 'rate': 4},
+            {'book': self.book_2.id, 'like': True, 'rate': 3},
+            {'book': self.book_3.id, 'in_bookmarks': True},
+        ]
+        json_data = json.dumps(data)
+        response = self.client.post(url, data=json_data, content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([(self.book_1.id, True, False, 4), (self.book_2.id, True, False, 3),
+                          (self.book_3.id, False, True, None)],
+                         [(item['book'], item['like'], item['in_bookmarks'], item['rate']) for item in response.data])
+        self.assertEqual(4, UserBookRelation.objects.count())
+
+        self.book_1.refresh_from_db()
+        self.book_2.refresh_from_db()
+        self.book_3.refresh_from_db()
+        self.assertEqual('4.00', str(self.book_1.rating))
+        self.assertEqual((1, 2, 8), (self.book_2.likes_count, self.book_2.readers_count, self.book_2.rating_sum))
+        self.assertEqual('4.00', str(self.book_2.rating))
+        self.assertEqual((1, 1), (self.book_3.bookmarks_count, self.book_3.readers_count))
+
+    def test_bulk_wrong(self):
+        url = reverse('userbookrelation-bulk')
+        self.client.force_login(self.user)
+        for data in ([], [{'book': self.book_1.id}, {'book': self.book_1.id}], [{'book': 1000}],
+                     [{'book': self.book_1.id, 'rate': 6}]):
+            json_data = json.dumps(data)
+            response = self.client.post(url, data=json_data, content_type='application/json')
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(0, UserBookRelation.objects.count())
+
+
+class BookAdminTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin_user')
+        self.book = Book.objects.create(name='Test book 1', price=25, author_name='Author 1', owner=self.user)
+        UserBookRelation.objects.create(user=self.user, book=self.book, like=True, rate=4)
+
+    def test_change(self):
+        url = reverse('admin:store_book_change', args=(self.book.id,))
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertNotIn('likes_count', response.context['adminform'].form.fields)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data={'name': 'Test book 2', 'price': 25, 'author_name': 'Author 1',
+                                                    'owner': self.user.id})
+        self.assertEqual(status.HTTP_302_FOUND, response.status_code)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "store_book"')]
+        self.assertEqual(1, len(updates))
+        self.assertNotIn('likes_count', updates[0])
+        self.book.refresh_from_db()
+        self.assertEqual(('Test book 2', 1, 4), (self.book.name, self.book.likes_count, self.book.rating_sum))
@@ -0,0 +1,112 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from store.models import Book, UserBookRelation
+
+
+class AsyncBooksApiTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.book_1 = Book.objects.create(name='Test book 1', price=25,
+                                          author_name='Author 1', owner=self.user)
+        self.book_2 = Book.objects.create(name='Test book 2', price=55,
+                                          author_name='Author 2')
+        self.book_3 = Book.objects.create(name='Test book 3 Author 1', price=65,
+                                          author_name='Author 1')
+        UserBookRelation.objects.create(user=self.user, book=self.book_2, like=True, rate=5)
+
+    async def assertSameAsSync(self, sync_url, async_url, data=None):
+        sync_response = await self.async_client.get(sync_url, data)
+        response = await self.async_client.get(async_url, data)
+        self.assertEqual(sync_response.status_code, response.status_code)
+        # pagination links differ only in the path prefix
+        self.assertEqual(json.loads(sync_response.content.decode().replace(sync_url, async_url)),
+                         json.loads(response.content))
+        return response
+
+    async def test_get(self):
+        await self.assertSameAsSync(reverse('book-list'), reverse('async-book-list'))
+
+    async def test_get_filter_search_ordering(self):
+        await self.assertSameAsSync(reverse('book-list'), reverse('async-book-list'), {'price': 55})
+        await self.assertSameAsSync(reverse('book-list'), reverse('async-book-list'), {'search': 'Author 1'})
+        await self.assertSameAsSync(reverse('book-list'), reverse('async-book-list'), {'ordering': '-price'})
+
+    @override_settings(BOOK_FAST_SERIALIZER=True)
+    async def test_get_fast_serializer(self):
+        response = await self.assertSameAsSync(reverse('book-list'), reverse('async-book-list'),
+                                               {'ordering': '-price', 'page_size': 2})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        books = json.loads(response.content)['results']
+        self.assertEqual([self.book_3.id, self.book_2.id], [book['id'] for book in books])
+        self.assertEqual([{'first_name': '', 'last_name': ''}], books[1]['readers'])
+
+    async def test_get_pages(self):
+        response = await self.assertSameAsSync(reverse('book-list'), reverse('async-book-list'),
+                                               {'ordering': 'price', 'page_size': 2})
+        next_url = json.loads(response.content)['next']
+        response = await self.async_client.get(next_url)
+        self.assertEqual([self.book_3.id], [book['id'] for book in json.loads(response.content)['results']])
+
+    async def test_get_invalid(self):
+        response = await self.assertSameAsSync(reverse('book-list'), reverse('async-book-list'),
+                                               {'cursor': 'garbage'})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+        response = await self.assertSameAsSync(reverse('book-list'), reverse('async-book-list'),
+                                               {'price': 'cheap'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    async def test_get_detail(self):
+        await self.assertSameAsSync(reverse('book-detail', args=(self.book_2.id,)),
+                                    reverse('async-book-detail', args=(self.book_2.id,)))
+        response = await self.async_client.get(reverse('async-book-detail', args=(1000,)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    async def test_get_not_allowed(self):
+        response = await self.async_client.delete(reverse('async-book-detail', args=(self.book_1.id,)))
+        self.assertEqual(status.HTTP_405_METHOD_NOT_ALLOWED, response.status_code)
+
+
+class AsyncUserBookRelationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.book = Book.objects.create(name='Test book 1', price=25, author_name='Author 1')
+        self.url = reverse('async-userbookrelation-detail', args=(self.book.id,))
+
+    async def test_rate(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.patch(self.url, data=json.dumps({'rate': 3, 'like': True}),
+                                                 content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        relation = await UserBookRelation.objects.aget(user=self.user, book=self.book)
+        self.assertEqual({'id': relation.id, 'book': self.book.id, 'like': True, 'in_bookmarks': False, 'rate': 3},
+                         json.loads(response.content))
+
+        response = await self.async_client.patch(self.url, data=json.dumps({'rate': 5}),
+                                                 content_type='application/json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        await self.book.arefresh_from_db()
+        self.assertEqual((5, 1, 1, 5.0), (self.book.rating_sum, self.book.rating_count,
+                                          self.book.likes_count, self.book.rating))
+
+    async def test_rate_wrong(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.patch(self.url, data=json.dumps({'rate': 6}),
+                                                 content_type='application/json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual({'rate': ['"6" is not a valid choice.']}, json.loads(response.content))
+
+        response = await self.async_client.patch(reverse('async-userbookrelation-detail', args=(1000,)),
+                                                 data=json.dumps({'rate': 3}), content_type='application/json')
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    async def test_rate_anonymous(self):
+        response = await self.async_client.patch(self.url, data=json.dumps({'rate': 3}),
+                                                 content_type='application/json')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.assertFalse(await UserBookRelation.objects.filter(book=self.book).aexists())
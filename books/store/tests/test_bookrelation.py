@@ -1,8 +1,14 @@
+from io import StringIO
+
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from store.bookrelation import set_rating
-from store.models import Book, UserBookRelation
+from store.models import Book, UserBookRelation, PendingRating
+from store.serializers import UserBookRelationSerializer
 
 
 class bookrelationTestCase(TestCase):
@@ -22,3 +28,119 @@ class bookrelationTestCase(TestCase):
         set_rating(self.book)
         self.book.refresh_from_db()
         self.assertEqual(4.67, float(self.book.rating))
+
+    def test_rating_stats_on_create(self):
+        self.book.refresh_from_db()
+        self.assertEqual(14, self.book.rating_sum)
+        self.assertEqual(3, self.book.rating_count)
+        self.assertEqual(4.67, float(self.book.rating))
+
+    def test_rating_stats_on_update(self):
+        relation = UserBookRelation.objects.get(user=self.user2, book=self.book)
+        relation.rate = 1
+        relation.save()
+        relation.rate = None
+        relation.save()
+        self.book.refresh_from_db()
+        self.assertEqual(10, self.book.rating_sum)
+        self.assertEqual(2, self.book.rating_count)
+        self.assertEqual(5, float(self.book.rating))
+
+    def test_rating_stats_on_delete(self):
+        UserBookRelation.objects.filter(user__in=[self.user, self.user3]).delete()
+        self.book.refresh_from_db()
+        self.assertEqual(4, self.book.rating_sum)
+        self.assertEqual(1, self.book.rating_count)
+        self.assertEqual(4, float(self.book.rating))
+
+        UserBookRelation.objects.get(user=self.user2).delete()
+        self.book.refresh_from_db()
+        self.assertEqual(0, self.book.rating_count)
+        self.assertIsNone(self.book.rating)
+
+    def test_delete_book(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.book.delete()
+        self.assertEqual([], [query['sql'] for query in queries if query['sql'].startswith('UPDATE')])
+        self.assertFalse(UserBookRelation.objects.exists())
+
+        book = Book.objects.create(name='Test book 2', price=25, author_name='Author 1')
+        UserBookRelation.objects.create(user=self.user, book=book, like=True)
+        with CaptureQueriesContext(connection) as queries:
+            Book.objects.filter(pk=book.pk).delete()
+        self.assertEqual([], [query['sql'] for query in queries if query['sql'].startswith('UPDATE')])
+
+    def test_rebuild_book_stats(self):
+        Book.objects.update(rating_sum=0, rating_count=0, rating=None)
+        call_command('rebuild_book_stats', stdout=StringIO())
+        self.book.refresh_from_db()
+        self.assertEqual(14, self.book.rating_sum)
+        self.assertEqual(3, self.book.rating_count)
+        self.assertEqual(4.67, float(self.book.rating))
+
+    def test_counters(self):
+        self.book.refresh_from_db()
+        self.assertEqual((3, 0, 3), (self.book.likes_count, self.book.bookmarks_count, self.book.readers_count))
+
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book)
+        relation.like = False
+        relation.in_bookmarks = True
+        relation.save()
+        UserBookRelation.objects.get(user=self.user3, book=self.book).delete()
+        self.book.refresh_from_db()
+        self.assertEqual((1, 1, 2), (self.book.likes_count, self.book.bookmarks_count, self.book.readers_count))
+
+        Book.objects.update(likes_count=0, bookmarks_count=0, readers_count=0)
+        call_command('rebuild_book_stats', stdout=StringIO())
+        self.book.refresh_from_db()
+        self.assertEqual((1, 1, 2), (self.book.likes_count, self.book.bookmarks_count, self.book.readers_count))
+
+    def test_save_update_fields(self):
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book)
+        relation.rate = 1
+        relation.like = False
+        relation.save(update_fields=['like'])
+        self.book.refresh_from_db()
+        self.assertEqual((14, 2), (self.book.rating_sum, self.book.likes_count))
+
+        relation.save(update_fields=['rate'])
+        self.book.refresh_from_db()
+        self.assertEqual((10, 2), (self.book.rating_sum, self.book.likes_count))
+
+    def test_save_without_loaded_values(self):
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book)
+        UserBookRelation(pk=relation.pk, user=self.user, book_id=self.book.pk, rate=1).save()
+        self.book.refresh_from_db()
+        self.assertEqual((10, 3, 2), (self.book.rating_sum, self.book.rating_count, self.book.likes_count))
+
+    def test_concurrent_updates(self):
+        # two requests load the same relation before either saves the same change
+        user = User.objects.create_user(username='test_user4')
+        UserBookRelation.objects.create(user=user, book=self.book)
+        serializers = [UserBookRelationSerializer(UserBookRelation.objects.get(user=user),
+                                                  data={'like': True, 'rate': 5}, partial=True)
+                       for _ in range(2)]
+        for serializer in serializers:
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        self.book.refresh_from_db()
+        self.assertEqual((19, 4, 4, 4), (self.book.rating_sum, self.book.rating_count,
+                                         self.book.likes_count, self.book.readers_count))
+
+    @override_settings(BOOK_RATING_DEFERRED=True)
+    def test_deferred_rating(self):
+        user = User.objects.create_user(username='test_user4')
+        UserBookRelation.objects.create(user=user, book=self.book, like=True, rate=1)
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book)
+        relation.rate = 1
+        relation.save()
+        self.book.refresh_from_db()
+        self.assertEqual(4.67, float(self.book.rating))
+        self.assertEqual((4, 4), (self.book.likes_count, self.book.readers_count))
+        self.assertEqual([self.book.id], list(PendingRating.objects.values_list('book_id', flat=True)))
+
+        call_command('process_rating_queue', '--once', stdout=StringIO())
+        self.book.refresh_from_db()
+        self.assertEqual((11, 4), (self.book.rating_sum, self.book.rating_count))
+        self.assertEqual(2.75, float(self.book.rating))
+        self.assertFalse(PendingRating.objects.exists())
@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from store.models import Book, UserBookRelation
+from store.search import get_backend
+
+
+class ImportBooksTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.user2 = User.objects.create_user(username='test_user2')
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def call(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_books', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_import(self):
+        books = self.write('books.csv', 'id,name,price,author_name\n'
+                                        '10,Test book 1,25,Author 1\n'
+                                        '11,Test book 2,55.5,Author 2\n'
+                                        ',Test book 3,abc,Author 3\n'
+                                        ',Test book 4,65,Author 3\n')
+        relations = self.write('relations.jsonl', '\n'.join(json.dumps(row) for row in [
+            {'user': self.user.id, 'book': 10, 'like': True, 'rate': 5},
+            {'user': self.user2.id, 'book': 10, 'rate': 3},
+            {'user': self.user.id, 'book': 11, 'in_bookmarks': True},
+            {'user': self.user.id, 'book': 1000, 'like': True},
+            {'user': self.user.id, 'book': 11, 'rate': 6},
+        ]))
+        stdout, stderr = self.call(books, '--relations', relations, '--batch-size', '2', '--owner', 'test_user')
+
+        self.assertIn('Imported 3 books and 3 relations', stdout)
+        self.assertIn('books.csv:4:', stderr)
+        self.assertIn('relations.jsonl:4:', stderr)
+        self.assertIn('relations.jsonl:5:', stderr)
+        self.assertEqual(['Test book 1', 'Test book 2', 'Test book 4'],
+                         list(Book.objects.order_by('id').values_list('name', flat=True)))
+        self.assertEqual(3, Book.objects.filter(owner=self.user).count())
+        self.assertEqual(3, UserBookRelation.objects.count())
+
+        book = Book.objects.get(pk=10)
+        self.assertEqual((8, 2, 1, 2), (book.rating_sum, book.rating_count, book.likes_count, book.readers_count))
+        self.assertEqual(1, Book.objects.get(pk=11).bookmarks_count)
+        # bulk_create skips the signals, the search index is rebuilt at the end
+        self.assertEqual([11], list(get_backend().filter(Book.objects.all(), ['Author 2']).values_list('id', flat=True)))
+
+    def test_import_again(self):
+        books = self.write('books.jsonl', json.dumps({'id': 10, 'name': 'Test book 1', 'price': 25,
+                                                      'author_name': 'Author 1'}))
+        self.call(books)
+        books = self.write('books.jsonl', json.dumps({'id': 10, 'name': 'Test book 1, 2nd edition',
+                                                      'price': 30, 'author_name': 'Author 1'}))
+        self.call(books)
+        self.assertEqual(['Test book 1, 2nd edition'], list(Book.objects.values_list('name', flat=True)))
+
+    def test_create_after_import(self):
+        books = self.write('books.jsonl', '\n'.join(json.dumps({'id': pk, 'name': f'Test book {pk}', 'price': 25,
+                                                                'author_name': 'Author 1'}) for pk in (10, 11)))
+        self.call(books)
+        # the id sequence has moved past the imported ids
+        book = Book.objects.create(name='Test book 12', price=25, author_name='Author 1')
+        self.assertGreater(book.id, 11)
+        self.assertEqual(3, Book.objects.count())
+
+    def test_import_wrong(self):
+        with self.assertRaises(CommandError):
+            self.call(self.write('books.xml', '<books/>'))
+        with self.assertRaises(CommandError):
+            self.call(self.write('books.jsonl', '{"name": '))
+        with self.assertRaises(CommandError):
+            self.call(self.write('books.csv', 'name,price,author_name\n'), '--owner', 'nobody')
@@ -0,0 +1,72 @@
+import json
+import os
+import re
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from store.metrics import registry
+from store.models import Book
+
+
+def metric(content, name, view, method='GET'):
+    match = re.search(rf'^{name}{{view="{view}",method="{method}"}} (\S+)$', content, re.M)
+    return float(match.group(1)) if match else None
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+                   BOOK_METRICS_ALLOWED_IPS=('127.0.0.1',))
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create_user(username='test_user')
+        self.book = Book.objects.create(name='Test book 1', price=25, author_name='Author 1')
+
+    def test_metrics(self):
+        self.client.get(reverse('book-list'))
+        self.client.get(reverse('book-list'))
+        self.client.get(reverse('book-detail', args=(self.book.id,)))
+        self.client.force_login(self.user)
+        self.client.patch(reverse('userbookrelation-detail', args=(self.book.id,)),
+                          data=json.dumps({'like': True}), content_type='application/json')
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(200, response.status_code)
+        content = response.content.decode()
+        self.assertEqual(2, metric(content, 'books_request_duration_seconds_count', 'book-list'))
+        self.assertEqual(6, metric(content, 'books_db_queries_total', 'book-list'))
+        self.assertEqual(3, metric(content, 'books_db_queries_total', 'book-detail'))
+        self.assertGreater(metric(content, 'books_serializer_seconds_total', 'book-list'), 0)
+        self.assertGreater(metric(content, 'books_db_query_seconds_total', 'book-list'), 0)
+        self.assertEqual(1, metric(content, 'books_request_duration_seconds_count',
+                                   'userbookrelation-detail', 'PATCH'))
+        self.assertIn('books_request_duration_seconds_bucket{view="book-list",method="GET",le="+Inf"} 2', content)
+        # /metrics itself is not recorded
+        self.assertNotIn('view="metrics"', content)
+
+    async def test_metrics_async(self):
+        await self.async_client.get(reverse('async-book-list'))
+        content = registry.render()
+        self.assertEqual(1, metric(content, 'books_request_duration_seconds_count', 'async-book-list'))
+        self.assertEqual(2, metric(content, 'books_db_queries_total', 'async-book-list'))
+
+    @override_settings(BOOK_METRICS_TOKEN='secret', BOOK_METRICS_ALLOWED_IPS=())
+    def test_metrics_token(self):
+        self.assertEqual(403, self.client.get(reverse('metrics')).status_code)
+        self.assertEqual(403, self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer guess').status_code)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(200, response.status_code)
+
+    def test_metrics_access(self):
+        self.assertEqual(403, self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1').status_code)
+        with self.settings(BOOK_METRICS_ALLOWED_IPS=()):
+            # off by default
+            self.assertEqual(404, self.client.get(reverse('metrics')).status_code)
+
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(BOOK_PROFILE_DIR=directory, BOOK_PROFILE_SAMPLE_RATE=1.0):
+                self.client.get(reverse('book-list'))
+            self.assertEqual(1, len([name for name in os.listdir(directory) if name.startswith('book-list-GET-')]))
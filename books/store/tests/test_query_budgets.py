@@ -0,0 +1,19 @@
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from store.benchmark import seed_catalog, run_benchmark, over_budget, QUERY_BUDGETS
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class QueryBudgetTestCase(APITestCase):
+    def check_budgets(self, books, users, relations):
+        seed_catalog(books, users, relations)
+        results = run_benchmark(self.client, repeat=2)
+        self.assertEqual({}, over_budget(results))
+        return {name: result['queries'] for name, result in results.items()}
+
+    def test_small_catalog(self):
+        self.assertEqual(QUERY_BUDGETS, self.check_budgets(books=20, users=10, relations=40))
+
+    def test_larger_catalog(self):
+        self.assertEqual(QUERY_BUDGETS, self.check_budgets(books=300, users=60, relations=1200))
@@ -0,0 +1,98 @@
+import json
+import re
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from store.benchmark import WORDS, seed_catalog
+from store.models import Book, BookSimilarity
+from store.pagination import encode_cursor
+
+# a walk of an index (bounded by LIMIT on keyset pages) is fine, a bare table scan is not
+SQLITE_SCAN = re.compile(r'^SCAN (?!\(|qualify\b|subquery\b)(\w+)\b(?! VIRTUAL TABLE INDEX| USING (?:COVERING )?INDEX)')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1].strip() for row in cursor.fetchall()]
+        cursor.execute('EXPLAIN ' + sql)
+        return [row[0].strip() for row in cursor.fetchall()]
+
+
+def full_scans(sql):
+    plan = explain(sql)
+    if connection.vendor == 'sqlite':
+        scans = [match.group(1) for match in map(SQLITE_SCAN.match, plan) if match]
+        # a rowid table is its own primary key index, SQLite shows the unfiltered
+        # walk of a page in id order as a bare SCAN; nothing else is let through
+        return [table for table in scans
+                if not (' WHERE ' not in sql and re.search(rf'ORDER BY "{table}"\."id" (ASC|DESC) LIMIT ', sql) and
+                        'USE TEMP B-TREE FOR ORDER BY' not in plan)]
+    return [match.group(1) for match in map(POSTGRES_SCAN.search, plan) if match]
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class QueryPlanTestCase(APITestCase):
+    def setUp(self):
+        seed_catalog(300, 30, 3000)
+        self.book = Book.objects.order_by('price', 'id')[150]
+        self.user = User.objects.filter(username__startswith='bench_user_').first()
+        if connection.vendor == 'postgresql':
+            # tiny tables are always seq scanned, only report the ones no index can serve
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertNoFullScans(self, request):
+        with CaptureQueriesContext(connection) as captured:
+            response = request()
+        self.assertLess(response.status_code, 300)
+        for query in captured.captured_queries:
+            sql = query['sql']
+            if sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                self.assertEqual([], full_scans(sql), sql)
+
+    def test_book_list(self):
+        url = reverse('book-list')
+        cursor = encode_cursor('price', self.book.price, self.book.id)
+        for params in [{}, {'price': str(self.book.price)}, {'ordering': 'price', 'cursor': cursor},
+                       {'ordering': '-price'}, {'ordering': 'author_name'}, {'search': WORDS[0]},
+                       {'min_price': '100', 'max_price': '120', 'ordering': 'price'},
+                       {'min_rating': '4.5', 'ordering': '-rating'}, {'author_prefix': 'Author 1'},
+                       {'ordering': '-rating'}, {'ordering': '-likes_count'}]:
+            with self.subTest(params=params):
+                self.assertNoFullScans(lambda: self.client.get(url, params))
+
+    def test_book_detail(self):
+        self.assertNoFullScans(lambda: self.client.get(reverse('book-detail', args=(self.book.id,))))
+        self.assertNoFullScans(lambda: self.client.get(reverse('book-readers', args=(self.book.id,))))
+        BookSimilarity.objects.bulk_create(BookSimilarity(book=self.book, similar=book, score=1 / book.id)
+                                           for book in Book.objects.exclude(pk=self.book.pk)[:30])
+        self.assertNoFullScans(lambda: self.client.get(reverse('book-similar', args=(self.book.id,))))
+
+    def test_book_top(self):
+        for params in [{}, {'by': 'likes'}, {'author_name': self.book.author_name},
+                       {'by': 'likes', 'author_name': self.book.author_name}]:
+            with self.subTest(params=params):
+                self.assertNoFullScans(lambda: self.client.get(reverse('book-top'), params))
+
+    def test_book_list_by_me(self):
+        self.client.force_login(self.user)
+        for params in [{'liked_by_me': 'true'}, {'bookmarked_by_me': 'true'}]:
+            with self.subTest(params=params):
+                self.assertNoFullScans(lambda: self.client.get(reverse('book-list'), params))
+
+    def test_relations(self):
+        self.client.force_login(self.user)
+        self.assertNoFullScans(lambda: self.client.patch(
+            reverse('userbookrelation-detail', args=(self.book.id,)),
+            data=json.dumps({'rate': 3, 'like': True}), content_type='application/json'))
+        self.assertNoFullScans(lambda: self.client.post(
+            reverse('userbookrelation-bulk'),
+            data=json.dumps([{'book': self.book.id, 'in_bookmarks': True}]), content_type='application/json'))
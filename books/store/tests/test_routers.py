@@ -0,0 +1,162 @@
+import json
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from store.cache import WRITTEN_KEY, get_cache
+from store.models import Book
+from store.routers import PIN_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware, replica_reads
+
+
+@override_settings(BOOK_REPLICA_DATABASES=['replica_1', 'replica_2'])
+class ReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def route(self, request, status=200):
+        # what the view behind the middleware would read Book from
+        databases = []
+
+        def view(request):
+            databases.append(self.router.db_for_read(Book))
+            return HttpResponse(status=status)
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return databases[0], response
+
+    def test_router(self):
+        self.assertEqual('default', self.router.db_for_read(Book))
+        token = replica_reads.set(True)
+        try:
+            self.assertIn(self.router.db_for_read(Book), ['replica_1', 'replica_2'])
+            # sessions and users are read right after they are written by the login
+            self.assertEqual('default', self.router.db_for_read(Session))
+            self.assertEqual('default', self.router.db_for_read(User))
+            self.assertEqual('default', self.router.db_for_write(Book))
+            with self.settings(BOOK_REPLICA_DATABASES=[]):
+                self.assertEqual('default', self.router.db_for_read(Book))
+        finally:
+            replica_reads.reset(token)
+
+    def test_relation(self):
+        book, user = Book(), User()
+        book._state.db, user._state.db = 'replica_1', 'default'
+        self.assertTrue(self.router.allow_relation(book, user))
+        user._state.db = 'other'
+        self.assertIsNone(self.router.allow_relation(book, user))
+
+    def test_middleware(self):
+        database, response = self.route(self.factory.get('/book/'))
+        self.assertIn(database, ['replica_1', 'replica_2'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertFalse(replica_reads.get())
+
+        database, response = self.route(self.factory.patch('/book_relation/1/'))
+        self.assertEqual('default', database)
+        self.assertEqual(settings.BOOK_REPLICA_PIN_SECONDS, response.cookies[PIN_COOKIE]['max-age'])
+
+        request = self.factory.get('/book/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual('default', self.route(request)[0])
+
+        database, response = self.route(self.factory.patch('/book_relation/1/'), status=400)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+@override_settings(BOOK_REPLICA_DATABASES=['stale_replica'])
+class ReplicaCacheTestCase(APITestCase):
+    # The stale replica is the test database seen through a router that records
+    # every read sent to it. Anything such a read returned right after a write
+    # may predate it, so it must not end up in the response cache.
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.other_user = User.objects.create_user(username='other_user')
+        self.book = Book.objects.create(name='Test book 1', price=25, author_name='Author 1')
+        self.replica_reads = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def stale_db_for_read(router, model, **hints):
+            database = db_for_read(router, model, **hints)
+            if database == 'stale_replica':
+                self.replica_reads.append(model)
+                return 'default'
+            return database
+
+        patcher = mock.patch.object(ReplicaRouter, 'db_for_read', stale_db_for_read)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cache_filled_once_replicas_caught_up(self):
+        url = reverse('book-detail', args=(self.book.id,))
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('userbookrelation-detail', args=(self.book.id,)),
+                              data=json.dumps({'like': True}), content_type='application/json')
+
+        # another client, not pinned, reads from the replica but caches nothing yet
+        self.client.cookies.pop(PIN_COOKIE)
+        self.client.force_login(self.other_user)
+        response = self.client.get(url)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertIn(Book, self.replica_reads)
+        self.assertEqual(1, response.data['annotated_likes'])
+        self.assertEqual('MISS', self.client.get(url)['X-Cache'])
+
+        # past BOOK_REPLICA_PIN_SECONDS the replica has the write
+        get_cache().delete(WRITTEN_KEY)
+        response = self.client.get(url)
+        self.assertEqual('MISS', response['X-Cache'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(304, response.status_code)
+        response = self.client.get(url)
+        self.assertEqual('HIT', response['X-Cache'])
+        self.assertEqual(1, response.json()['annotated_likes'])
+
+    def test_pinned_misses_cached(self):
+        url = reverse('book-detail', args=(self.book.id,))
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('userbookrelation-detail', args=(self.book.id,)),
+                              data=json.dumps({'like': True}), content_type='application/json')
+        # the writer reads its like from the primary, safe to cache at once
+        self.assertEqual('MISS', self.client.get(url)['X-Cache'])
+        self.assertEqual([], self.replica_reads)
+        self.assertEqual('HIT', self.client.get(url)['X-Cache'])
+
+
+@skipUnless('replica' in settings.DATABASES, 'set BOOKS_DB_REPLICA_NAME to run against a replica')
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class ReplicaTestCase(APITransactionTestCase):
+    # the test replica mirrors the test primary, only the alias a query ran on
+    # differs; committed, so the replica's own connection sees the rows
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.book = Book.objects.create(name='Test book 1', price=25, author_name='Author 1')
+
+    def get(self):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(reverse('book-detail', args=(self.book.id,)))
+        self.assertEqual(200, response.status_code)
+        return len(replica)
+
+    def test_read_your_writes(self):
+        self.client.force_login(self.user)
+        self.assertGreater(self.get(), 0)
+        response = self.client.patch(reverse('userbookrelation-detail', args=(self.book.id,)),
+                                     data=json.dumps({'like': True}), content_type='application/json')
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(0, self.get())
+        self.client.cookies.pop(PIN_COOKIE)
+        self.assertGreater(self.get(), 0)
@@ -1,9 +1,10 @@
 from django.contrib.auth.models import User
-from django.db.models import Count, Case, When, Avg, F
-from django.test import TestCase
+from django.db.models import F
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
 
 from store.models import Book, UserBookRelation
-from store.serializers import BooksSerializer
+from store.serializers import BooksSerializer, FastBooksSerializer
 
 
 class BookSerializerTestCase(TestCase):
@@ -27,7 +28,6 @@ class BookSerializerTestCase(TestCase):
         UserBookRelation.objects.create(user=self.user3, book=self.book_2, like=False)
 
         books = Book.objects.all().annotate(
-            annotated_likes=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name=F('owner__username'),
         ).order_by('id')
         data = BooksSerializer(books, many=True).data
@@ -39,6 +39,8 @@ class BookSerializerTestCase(TestCase):
                 'author_name': 'Author 1',
                 # 'likes_count': 3,
                 'annotated_likes': 3,
+                'bookmarks_count': 0,
+                'readers_count': 3,
                 'rating': '4.67',
                 'owner_name': self.user.username,
                 'readers': [
@@ -63,6 +65,8 @@ class BookSerializerTestCase(TestCase):
                 'author_name': 'Author 3',
                 # 'likes_count': 2,
                 'annotated_likes': 2,
+                'bookmarks_count': 0,
+                'readers_count': 3,
                 'rating': '2.50',
                 'owner_name': self.user.username,
                 'readers': [
@@ -84,3 +88,19 @@ class BookSerializerTestCase(TestCase):
         print(expected_data, sep='\n\n')
         print(data, sep='\n\n')
         self.assertEqual(expected_data, data)
+
+    @override_settings(BOOK_READERS_PREVIEW_SIZE=2)
+    def test_fast(self):
+        UserBookRelation.objects.create(user=self.user3, book=self.book_1, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, in_bookmarks=True, rate=4)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1, like=True)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_2)
+        Book.objects.create(name='Test book 3', price='10.50', author_name='Author 2')
+
+        books = Book.objects.all().annotate(
+            owner_name=F('owner__username'),
+        ).order_by('id')
+        expected = JSONRenderer().render(BooksSerializer(books, many=True).data)
+        with self.assertNumQueries(2):
+            data = FastBooksSerializer(list(FastBooksSerializer.get_rows(books))).data
+        self.assertEqual(expected, JSONRenderer().render(data))
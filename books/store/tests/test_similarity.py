@@ -0,0 +1,95 @@
+from datetime import timedelta
+from importlib.util import find_spec
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, BookSimilarity, UserBookRelation
+
+
+def neighbours(book):
+    return list(BookSimilarity.objects.filter(book=book).order_by('-score', 'similar')
+                .values_list('similar_id', 'score'))
+
+
+@skipUnless(find_spec('numpy') and find_spec('scipy'), 'numpy and scipy are optional')
+class ComputeSimilarBooksTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'test_user_{i}') for i in range(4)]
+        self.books = [Book.objects.create(name=f'Test book {i}', price=25, author_name='Author 1')
+                      for i in range(4)]
+        # books 0 and 1 share three readers, 0 and 2 two, 3 is rated too low to count
+        for user, book in [(0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1), (3, 1), (0, 2), (1, 2)]:
+            UserBookRelation.objects.create(user=self.users[user], book=self.books[book], like=True)
+        UserBookRelation.objects.create(user=self.users[0], book=self.books[3], rate=2)
+
+    def call(self, *args):
+        stdout = StringIO()
+        call_command('compute_similar_books', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_compute(self):
+        self.assertIn('Stored 6 neighbours for 3 books', self.call())
+        book_0, book_1, book_2, book_3 = self.books
+        cosine = 3 / (3 * 4) ** 0.5
+        self.assertEqual([book_1.id, book_2.id], [pk for pk, score in neighbours(book_0)])
+        self.assertAlmostEqual(cosine, neighbours(book_0)[0][1], places=6)
+        self.assertAlmostEqual(2 / (3 * 2) ** 0.5, neighbours(book_0)[1][1], places=6)
+        self.assertEqual([book_0.id, book_2.id], [pk for pk, score in neighbours(book_1)])
+        self.assertEqual([], neighbours(book_3))
+
+        self.call('--top-k', '1', '--min-common', '3')
+        self.assertEqual([book_1.id], [pk for pk, score in neighbours(book_0)])
+        self.assertEqual([], neighbours(book_2))
+
+    def test_compute_since(self):
+        self.call()
+        book_0, book_1, book_2, book_3 = self.books
+        since = timezone.now()
+        UserBookRelation.objects.filter(book=book_2).update(like=False)
+        # a plain update() skips the stats, the book is touched the way they would
+        Book.objects.filter(pk=book_2.pk).update(updated_at=since + timedelta(seconds=1))
+        self.assertIn('for 0 books', self.call('--since', since.isoformat()))
+        self.assertEqual([], neighbours(book_2))
+        # only the changed book is refreshed
+        self.assertEqual([book_1.id, book_2.id], [pk for pk, score in neighbours(book_0)])
+
+
+class SimilarBooksApiTestCase(APITestCase):
+    def setUp(self):
+        self.books = [Book.objects.create(name=f'Test book {i}', price=25, author_name='Author 1')
+                      for i in range(4)]
+        book_0, book_1, book_2, book_3 = self.books
+        BookSimilarity.objects.bulk_create([
+            BookSimilarity(book=book_0, similar=book_2, score=0.5),
+            BookSimilarity(book=book_0, similar=book_1, score=0.9),
+            BookSimilarity(book=book_0, similar=book_3, score=0.5),
+            BookSimilarity(book=book_1, similar=book_0, score=0.9),
+        ])
+
+    def test_similar(self):
+        book_0, book_1, book_2, book_3 = self.books
+        url = reverse('book-similar', args=(book_0.id,))
+        response = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([book_1.id, book_2.id, book_3.id], [book['id'] for book in response.data])
+        self.assertEqual('Test book 1', response.data[0]['name'])
+        response = self.client.get(url, data={'limit': 1})
+        self.assertEqual([book_1.id], [book['id'] for book in response.data])
+        response = self.client.get(url, data={'limit': 0})
+        self.assertEqual([book_1.id], [book['id'] for book in response.data])
+        with self.settings(BOOK_SIMILAR_SIZE=1, BOOK_SIMILAR_TOP_K=2):
+            self.assertEqual(1, len(self.client.get(url).data))
+            self.assertEqual(2, len(self.client.get(url, data={'limit': 1000}).data))
+
+        response = self.client.get(reverse('book-similar', args=(book_3.id,)))
+        self.assertEqual([], response.data)
+        response = self.client.get(reverse('book-similar', args=(1000,)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
@@ -1,52 +1,198 @@
-from django.db.models import Count, Case, When, Avg, F
-from django.shortcuts import render
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Count, F, Max, Prefetch, Sum
+from django.shortcuts import render, get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.mixins import UpdateModelMixin
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
+from store.bookrelation import USER_RELATION_FIELDS, annotate_user_relation, bulk_update_relations
+from store.cache import LIST_VERSION_KEY, CachedResponseMixin
+from store.export import EXPORT_FORMATS, export_response
+from store.filters import BookFilter, BookOrderingFilter
 from store.models import Book, UserBookRelation
 from store.permissions import IsOwnerOrStaffOrReadOnly
-from store.serializers import BooksSerializer, UserBookRelationSerializer
+from store.search import BookSearchFilter
+from store.pagination import KeysetPagination, ReadersPagination
+from store.serializers import BooksSerializer, UserBookRelationSerializer, BookReaderSerializer, \
+    UserBookRelationBulkSerializer, FastBooksSerializer
 
 
-class BookViewSet(ModelViewSet):
+class BookViewSet(CachedResponseMixin, ModelViewSet):
     queryset = Book.objects.all().annotate(
-            annotated_likes=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name = F('owner__username'),
             #rating = Avg('userbookrelation__rate')
-        ).prefetch_related('readers')
+        )
     serializer_class = BooksSerializer
     permission_classes = [IsOwnerOrStaffOrReadOnly]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filter_fields = ['price']
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, BookSearchFilter, BookOrderingFilter]
+    filterset_class = BookFilter
+    per_user_params = (*BookFilter.user_filters, 'my_relation')
     search_fields = ['name', 'author_name']
-    ordering_fields = ['price', 'author_name']
+    ordering_fields = ['price', 'author_name', 'rating', 'likes_count']
+    # ?by= of the top action
+    leaderboards = {'rating': 'rating', 'likes': 'likes_count'}
+    # writes and the readers page only need the row itself: the owner for the
+    # permission check and the columns the search index is built from
+    light_actions = ('update', 'partial_update', 'destroy', 'readers', 'similar')
+    light_fields = ('id', 'owner', 'name', 'price', 'author_name', 'updated_at')
+
+    @property
+    def fast_list(self):
+        return self.action == 'list' and settings.BOOK_FAST_SERIALIZER
+
+    @property
+    def my_relation(self):
+        # ?my_relation=true adds the signed-in user's like, bookmark and rate to every book
+        return (self.action in ('list', 'retrieve') and self.request.user.is_authenticated and
+                self.request.query_params.get('my_relation') in ('1', 'true', 'True'))
+
+    def get_books_queryset(self):
+        # built per request, so BOOK_READERS_PREVIEW_SIZE is read when it is used
+        return super().get_queryset().prefetch_related(
+            # sliced prefetch is limited per book with a ROW_NUMBER() window
+            Prefetch('readers', queryset=User.objects.only('id', 'first_name', 'last_name')
+                     .order_by('id')[:settings.BOOK_READERS_PREVIEW_SIZE],
+                     to_attr='readers_preview')
+        )
+
+    def get_queryset(self):
+        if self.action in self.light_actions:
+            # save() on a deferred instance only writes the loaded columns, so
+            # the counters moved by the stats UPDATEs are never overwritten
+            return Book.objects.only(*self.light_fields)
+        queryset = self.get_books_queryset()
+        if self.my_relation:
+            queryset = annotate_user_relation(queryset, self.request.user)
+        return queryset
+
+    def get_validators(self):
+        # what is on the page and when it last changed, without loading or serializing it
+        if self.action == 'top':
+            queryset = self.get_leaderboard_queryset().prefetch_related(None)
+        elif self.action == 'list':
+            queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+            queryset = self.paginator.get_page_queryset(queryset, self.request)
+        else:
+            queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+            try:
+                queryset = queryset.filter(pk=self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+            except (TypeError, ValueError, DjangoValidationError):
+                return None
+        aggregates = {'last_modified': Max('updated_at'), 'count': Count('pk'), 'ids': Sum('pk')}
+        if self.my_relation:
+            aggregates['my_last_modified'] = Max('my_updated_at')
+        values = queryset.aggregate(**aggregates)
+        if not values['count']:
+            return None
+        my_last_modified = values.pop('my_last_modified', None)
+        if my_last_modified is not None and my_last_modified > values['last_modified']:
+            values['last_modified'] = my_last_modified
+        if self.action != 'retrieve':
+            # a page loses books to deletes and filters, an older book taking
+            # their place could move its Last-Modified back; only the ETag then
+            values['modified'] = values.pop('last_modified')
+        return values
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'my_relation': self.my_relation}
+
+    def paginate_queryset(self, queryset):
+        if not self.fast_list:
+            return super().paginate_queryset(queryset)
+        return self.paginator.get_page(list(self.get_fast_rows(queryset)))
+
+    def get_fast_rows(self, queryset):
+        # the page query for FastBooksSerializer, not run yet so async views can await it
+        paginator = self.paginator
+        queryset = paginator.get_page_queryset(queryset, self.request)
+        extra = [paginator.field, *(USER_RELATION_FIELDS if self.my_relation else ())]
+        return FastBooksSerializer.get_rows(queryset, *extra)
+
+    def get_serializer(self, *args, **kwargs):
+        if self.fast_list:
+            return FastBooksSerializer(*args, my_relation=self.my_relation)
+        return super().get_serializer(*args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=kwargs.pop('partial', False))
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        # the annotated query runs once, for the body
+        book = self.get_books_queryset().get(pk=instance.pk)
+        return Response(self.get_serializer(book).data)
 
     def perform_create(self, serializer):
         serializer.validated_data['owner'] = self.request.user
 
         serializer.save()
 
+    @action(detail=True, pagination_class=ReadersPagination)
+    def readers(self, request, pk=None):
+        book = self.get_object()
+        queryset = User.objects.filter(books=book).only('id', 'first_name', 'last_name')
+        page = self.paginate_queryset(queryset)
+        serializer = BookReaderSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
-'''
-    def filter_queryset(self, request):
-        predicate = self.request.query_params  # or request.data for POST
-        queryset = self.queryset
-        #print(queryset, sep='\n')
-        if predicate.get('min_price', None) is not None and predicate.get('max_price', None) is not None:
-            queryset = self.queryset.filter(price__range=(predicate['min_price'], predicate['max_price']))
-            #print(1, sep='\n')
-        if predicate.get('min_price', None) is not None and predicate.get('max_price', None) is None:
-            queryset = self.queryset.filter(price__gte=predicate['min_price'])
-            #print(2, sep='\n')
-        if predicate.get('max_price', None) is not None and predicate.get('min_price', None) is None:
-            queryset = self.queryset.filter(price__lte=predicate['max_price'])
-            #print(3, sep='\n')
-        #print(queryset, sep='\n')
-        return queryset
-'''
+    def get_leaderboard_queryset(self):
+        # rating and likes_count are kept current by the stats UPDATEs, so a top-N
+        # read walks the first N entries of their index, per author when one is given
+        by = self.request.query_params.get('by', 'rating')
+        if by not in self.leaderboards:
+            raise ValidationError({'by': [f'Choose one of: {", ".join(self.leaderboards)}.']})
+        field = self.leaderboards[by]
+        queryset = self.get_queryset()
+        author_name = self.request.query_params.get('author_name')
+        if author_name is not None:
+            queryset = queryset.filter(author_name=author_name)
+        if field == 'rating':
+            queryset = queryset.filter(rating__isnull=False)
+        else:
+            queryset = queryset.filter(**{f'{field}__gt': 0})
+        try:
+            limit = int(self.request.query_params['limit'])
+        except (KeyError, ValueError):
+            limit = settings.BOOK_LEADERBOARD_SIZE
+        limit = min(max(limit, 1), KeysetPagination.max_page_size)
+        return queryset.order_by(f'-{field}', '-id')[:limit]
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        # "readers who liked this also liked", stored by compute_similar_books and
+        # read best first from store_similarity_book_idx
+        book = self.get_object()
+        try:
+            limit = int(request.query_params['limit'])
+        except (KeyError, ValueError):
+            limit = settings.BOOK_SIMILAR_SIZE
+        # no more than the job stores per book
+        limit = min(max(limit, 1), settings.BOOK_SIMILAR_TOP_K)
+        books = self.get_books_queryset().filter(similar_to__book=book).order_by('-similar_to__score', 'similar_to__similar')
+        return Response(self.get_serializer(books[:limit], many=True).data)
+
+    @action(detail=False)
+    def top(self, request):
+        return self.cached_response(request, LIST_VERSION_KEY, self.leaderboard)
+
+    def leaderboard(self, request):
+        return Response(self.get_serializer(self.get_leaderboard_queryset(), many=True).data)
+
+    @action(detail=False)
+    def export(self, request):
+        # ?format= is taken by DRF's format suffixes
+        file_format = request.query_params.get('file_format', 'jsonl')
+        if file_format not in EXPORT_FORMATS:
+            raise ValidationError({'file_format': [f'Choose one of: {", ".join(EXPORT_FORMATS)}.']})
+        return export_response(self.filter_queryset(self.get_queryset()), file_format)
 
 
 class UserBookRelationViewSet(UpdateModelMixin, GenericViewSet):
@@ -56,9 +202,33 @@ class UserBookRelationViewSet(UpdateModelMixin, GenericViewSet):
     lookup_field = 'book'
 
     def get_object(self):
-        obj, _ = UserBookRelation.objects.get_or_create(user=self.request.user, book_id=self.kwargs['book'])
+        obj = UserBookRelation.objects.filter(user=self.request.user, book_id=self.kwargs['book']).first()
+        if obj is None:
+            book = get_object_or_404(Book.objects.only('id'), pk=self.kwargs['book'])
+            obj = UserBookRelation(user=self.request.user, book=book)
         return obj
 
+    def perform_update(self, serializer):
+        # a new relation is written with a single INSERT; if a concurrent
+        # request created it first, the unique constraint rejects ours and
+        # the change is applied to the row that won instead
+        try:
+            serializer.save()
+        except IntegrityError:
+            if not serializer.instance._state.adding:
+                raise
+            serializer.instance = UserBookRelation.objects.get(user=self.request.user,
+                                                               book_id=self.kwargs['book'])
+            serializer.save()
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        serializer = UserBookRelationBulkSerializer(data=request.data, many=True, allow_empty=False,
+                                                    max_length=settings.BOOK_RELATION_BULK_MAX_ITEMS)
+        serializer.is_valid(raise_exception=True)
+        relations = bulk_update_relations(request.user, serializer.validated_data)
+        return Response(UserBookRelationSerializer(relations, many=True).data)
+
 
 
 def auth(request):